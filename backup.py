@@ -0,0 +1,310 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import glob
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+from PySide6.QtCore import QObject, Signal, Slot
+
+from connections import BUSY_TIMEOUT_MS
+from database import MAX_CHANGES, MIGRATIONS
+
+# Online backups of the book with SQLite's backup API, which copies the pages of
+# a live database a few at a time and starts over should another connection
+# change it meanwhile. QtSql does not offer the API; Python's sqlite3 module
+# does, but it is a second copy of SQLite. Two copies in one process do not see
+# each other's POSIX locks, and closing the file in one drops the locks of the
+# other, so a backup or restore always runs in a process of its own that never
+# opens the book through QtSql: BackupWorker starts "python -m backup" and
+# relays its progress, and "mycontacts backup" and "restore" skip QtSql.
+# Several instances may share the book and back it up at the same time, so
+# every copy in the making is named after the process that writes it.
+
+PAGES_PER_STEP = 256        # pages copied between two looks at the lock, 1 MB of 4 KB pages
+MAX_RESTARTS = 3            # after that many restarts the rest is copied in one step
+GENERATIONS = 7             # backups kept per book, the oldest are removed
+BACKUP_INTERVAL = 24 * 3600     # seconds after which the application backs up on login
+BACKUP_DIR = 'backups'      # next to the book
+STALE_PARTIAL = 24 * 3600   # seconds after which an unfinished copy is taken for left behind
+
+
+class BackupError(Exception):
+    pass
+
+
+class Restarted(Exception):
+    pass
+
+
+def backup_dir(database):
+    return os.path.join(os.path.dirname(os.path.abspath(database)), BACKUP_DIR)
+
+
+def list_backups(database):
+    # paths of the generations kept for the book, newest first
+    stem = os.path.splitext(os.path.basename(database))[0]
+    return sorted(glob.glob(os.path.join(backup_dir(database), f'{stem}-*.sqlite')), reverse=True)
+
+
+def backup_due(database):
+    backups = list_backups(database)
+    return not backups or time.time() - os.path.getmtime(backups[0]) > BACKUP_INTERVAL
+
+
+def connect(path):
+    return sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+
+
+def copy_pages(source, target, progress=None, cancelled=None):
+    # the backup API step by step, readers and writers of the source get their
+    # turn between steps; should the source keep changing under it, the copy
+    # would never end, so it is finally taken in one step, under one read lock
+    state = {'remaining': None, 'restarts': 0}
+
+    def step(status, remaining, total):
+        if cancelled is not None and cancelled():
+            raise BackupError('Cancelled')
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > MAX_RESTARTS:
+                raise Restarted()
+        state['remaining'] = remaining
+        if progress is not None:
+            progress(int((total - remaining) * 100 / (total or 1)))
+
+    try:
+        source.backup(target, pages=PAGES_PER_STEP, progress=step)
+    except Restarted:
+        source.backup(target)
+        if progress is not None:
+            progress(100)
+
+
+def verify(path, restoring=False):
+    # problems found in the file, none for a sound book; one to restore must also
+    # be of the schema version of the instances that have the book open
+    try:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            problems = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as error:
+        return [str(error)]
+    if problems != ['ok']:
+        return problems
+    if not {'contacts', 'users'} <= tables:
+        return ['not a contacts book']
+    if restoring and version != len(MIGRATIONS):
+        return [f'schema version {version}, this version of MyContacts needs {len(MIGRATIONS)}']
+    return []
+
+
+def rotate(database):
+    for path in list_backups(database)[GENERATIONS:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass        # rotated by another instance meanwhile
+
+
+def partial_name(folder, pid=None):
+    # the unfinished copy of the backup or restore run by the process
+    return os.path.join(folder, f'{pid or os.getpid()}.partial')
+
+
+def remove_stale(folder):
+    # copies left by killed processes; a running one keeps its copy recent
+    for partial in glob.glob(os.path.join(folder, '*.partial')):
+        try:
+            if time.time() - os.path.getmtime(partial) > STALE_PARTIAL:
+                os.remove(partial)
+        except FileNotFoundError:
+            pass
+
+
+def new_backup_name(database):
+    # the time of the backup and the process taking it, so that backups taken by
+    # several instances in the same second do not replace each other
+    stem = os.path.splitext(os.path.basename(database))[0]
+    name = f'{stem}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}'
+    path = os.path.join(backup_dir(database), f'{name}.sqlite')
+    number = 1
+    while os.path.exists(path):
+        number += 1
+        path = os.path.join(backup_dir(database), f'{name}-{number}.sqlite')
+    return path
+
+
+def backup_book(database, progress=None, cancelled=None):
+    # a verified copy of the book as a new generation, returns its path
+    folder = backup_dir(database)
+    os.makedirs(folder, exist_ok=True)
+    remove_stale(folder)
+    partial = partial_name(folder)
+
+    try:
+        source, target = connect(database), connect(partial)
+        try:
+            copy_pages(source, target, progress, cancelled)
+            # a single file whatever the journal mode of the book
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            source.close()
+            target.close()
+        problems = verify(partial)
+        if problems:
+            raise BackupError(f'The backup is damaged: {problems[0]}')
+        path = new_backup_name(database)
+        os.replace(partial, path)
+    except sqlite3.Error as error:
+        raise BackupError(str(error))
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    rotate(database)
+    return path
+
+
+def restore_book(database, path, progress=None, cancelled=None):
+    # Replaces the contents of the book with a backup, in one transaction, so
+    # that the instances that have it open see the change like any other write.
+    # The backup API copies a file as it is, so the backup is first copied next
+    # to the book and the change log of that copy numbered past every entry the
+    # instances may have seen, which makes them read the whole book again; the
+    # copy then goes into the book.
+    problems = verify(path, restoring=True)
+    if problems:
+        raise BackupError(f'{os.path.basename(path)} cannot be restored: {problems[0]}')
+    folder = backup_dir(database)
+    os.makedirs(folder, exist_ok=True)
+    partial = partial_name(folder)
+
+    def half(start):
+        return None if progress is None else lambda percent: progress(start + percent // 2)
+
+    try:
+        source, copy, target = connect(path), connect(partial), connect(database)
+        try:
+            copy_pages(source, copy, half(0), cancelled)
+            row = target.execute("SELECT seq FROM sqlite_sequence WHERE name = 'contact_changes'").fetchone()
+            seq = (row[0] if row else 0) + MAX_CHANGES
+            if not copy.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'contact_changes'",
+                                (seq,)).rowcount:
+                copy.execute("INSERT INTO sqlite_sequence(name, seq) VALUES ('contact_changes', ?)", (seq,))
+            copy_pages(copy, target, half(50), cancelled)
+        finally:
+            source.close()
+            copy.close()
+            target.close()
+    except sqlite3.Error as error:
+        raise BackupError(str(error))
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return path
+
+
+class BackupWorker(QObject):
+    # runs "python -m backup" and reports its progress; finished gets the backup's path
+    progress = Signal(int, str)
+    finished = Signal(str)
+    failed = Signal(str)
+
+    def __init__(self, database, restore=None):
+        super().__init__()
+        self.database = os.path.abspath(database)
+        self.restore = restore          # backup to restore, None to make one
+        self.child = None
+        self.stopped = False
+
+    @property
+    def cancelled(self):
+        return self.stopped
+
+    @cancelled.setter
+    def cancelled(self, value):
+        # Set from the GUI thread. The child is killed right away: it says
+        # nothing for long stretches, e.g. while checking a large copy, and a
+        # restore killed half way leaves the book as it was.
+        self.stopped = value
+        child = self.child
+        if value and child is not None and child.poll() is None:
+            child.kill()
+
+    @Slot()
+    def run(self):
+        if self.restore is None:
+            command, label = ['backup', self.database], 'Backing up'
+        else:
+            command, label = ['restore', self.database, self.restore], 'Restoring'
+        try:
+            self.child = subprocess.Popen([sys.executable, '-m', 'backup', *command],
+                                          cwd=os.path.dirname(os.path.abspath(__file__)),
+                                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        except OSError as error:
+            self.failed.emit(str(error))
+            return
+        if self.stopped:
+            self.child.kill()
+
+        path = None
+        for line in self.child.stdout:
+            kind, _, value = line.rstrip('\n').partition(' ')
+            if kind == 'progress':
+                self.progress.emit(int(value), f'{label} the contacts... {value}%')
+            elif kind == 'done':
+                path = value
+        error = self.child.stderr.read().strip()
+        self.child.wait()
+
+        if self.stopped:
+            partial = partial_name(backup_dir(self.database), self.child.pid)
+            if os.path.exists(partial):
+                os.remove(partial)
+            self.failed.emit(f'{label} cancelled')
+        elif self.child.returncode or path is None:
+            self.failed.emit(error or f'{label} failed')
+        else:
+            self.finished.emit(path)
+
+
+def main(argv):
+    # the child process of BackupWorker: progress and result on stdout, one per line
+    def report(percent):
+        print(f'progress {percent}', flush=True)
+
+    try:
+        if argv[0] == 'backup':
+            path = backup_book(argv[1], report)
+        else:
+            path = restore_book(argv[1], argv[2], report)
+    except BackupError as error:
+        sys.exit(str(error))
+    print(f'done {path}', flush=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,298 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import PySide6
+from PySide6.QtCore import Qt, QEventLoop
+from PySide6.QtWidgets import QApplication
+
+from connections import PROFILES
+
+# Times the real code paths on synthetic contact books, e.g.
+#   python benchmark.py --rows 10000 100000 1000000 --output before.json
+# Books are generated once per size and seed and reused from --workdir.
+
+SIZES = (10000, 100000, 1000000)
+REPEAT = 5
+SEARCHES = {1: 'name', 2: 'job', 3: 'location', 4: 'contact'}
+BURST = 1000                # contacts added back to back
+
+# Real names repeat a few common parts, so that some trigrams (' SH', 'AN ', ...) are in a
+# large share of the book; random letters spread them evenly and flatter the trigram index.
+FIRST_NAMES = """
+    RAHUL PRIYA AMIT SUNITA RAJESH ANITA SANJAY POOJA VIJAY NEHA SURESH KAVITA ANIL ANJALI RAMESH
+    DEEPA MANOJ SHALINI ARUN REKHA ASHOK MEENA MOHAMMED FATIMA ABDUL AYESHA IMRAN NASREEN SALMAN
+    ZARA MANISH SEEMA RAVI SONIA KIRAN LATA ARJUN ISHA KARAN DIVYA ROHAN SNEHA VIKRAM SHREYA ADITYA
+    NISHA JOHN MARY DAVID SARAH JAMES ANNA MICHAEL MARIA ROBERT LINDA THOMAS ELIZABETH JOSEPH
+    JENNIFER DANIEL LISA PAUL SUSAN MARK KAREN GEORGE NANCY PETER LAURA ANDREW EMMA
+""".split()
+SURNAMES = """
+    SHARMA SINGH KUMAR PATEL GUPTA KHAN SARKAR DAS SHAH REDDY YADAV JAIN MEHTA CHOPRA VERMA RAO
+    IYER NAIR MISHRA PANDEY AHMED ALI HUSSAIN BANERJEE CHATTERJEE MUKHERJEE GHOSH BOSE SEN DUTTA
+    JOSHI KULKARNI DESAI PILLAI MENON SMITH JOHNSON WILLIAMS BROWN JONES MILLER DAVIS WILSON
+    ANDERSON TAYLOR THOMAS MOORE MARTIN JACKSON WHITE HARRIS CLARK LEWIS ROBINSON WALKER
+""".split()
+
+
+def generate_book(path, rows, seed=1975, names='realistic'):
+    # plain sqlite3 for speed, the schema is then upgraded by database.createTables()
+    rnd = random.Random(seed)
+    words = [''.join(rnd.choice(string.ascii_uppercase) for _ in range(rnd.randint(3, 9))) for _ in range(5000)]
+    jobs = words[:300]
+    locations = words[300:1300]
+    if names == 'realistic':
+        # Zipf weights, the first names of the lists are the most common
+        first_weights = [1 / rank for rank in range(1, len(FIRST_NAMES) + 1)]
+        last_weights = [1 / rank for rank in range(1, len(SURNAMES) + 1)]
+
+        def name():
+            return f'{rnd.choices(FIRST_NAMES, first_weights)[0]} {rnd.choices(SURNAMES, last_weights)[0]}'
+    else:
+        def name():
+            return f'{rnd.choice(words)} {rnd.choice(words)}'
+    conn = sqlite3.connect(path)
+    conn.execute("""
+            CREATE TABLE contacts(
+            id INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL,
+            name       VARCHAR(30)  NOT NULL,
+            job        VARCHAR(20)  NOT NULL,
+            location   VARCHAR(20)  NOT NULL,
+            contact    CHAR(10)     NOT NULL)
+        """)
+    numbers = rnd.sample(range(6000000000, 10000000000), rows)
+    conn.executemany("INSERT INTO contacts(name, job, location, contact) VALUES (?, ?, ?, ?)",
+                     ((name(), rnd.choice(jobs), rnd.choice(locations), str(number)) for number in numbers))
+    conn.commit()
+    conn.close()
+
+
+def book(workdir, rows, seed, names):
+    from database import createTables
+
+    path = os.path.join(workdir, f'contacts-{rows}-{seed}-{names}.sqlite')
+    if not os.path.exists(path):
+        generate_book(path + '.tmp', rows, seed, names)
+        os.replace(path + '.tmp', path)
+    # books kept from an older revision are brought up to the current schema
+    open_database(path)
+    start = perf_counter()
+    createTables()
+    print(f'migrated {rows} rows in {perf_counter() - start:.1f} s', file=sys.stderr)
+    close_database()
+    return path
+
+
+def used_megabytes(path):
+    # pages in use, those a schema upgrade left free do not count
+    conn = sqlite3.connect(path)
+    pages = conn.execute('PRAGMA page_count').fetchone()[0] - conn.execute('PRAGMA freelist_count').fetchone()[0]
+    size = pages * conn.execute('PRAGMA page_size').fetchone()[0]
+    conn.close()
+    return round(size / 2 ** 20, 1)
+
+
+def timed(func, repeat=REPEAT):
+    # median milliseconds of repeat calls
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        times.append((perf_counter() - start) * 1000)
+    return round(statistics.median(times), 3)
+
+
+def wait_for_search(app, window, text):
+    done = []
+    window.search.resultsReady.connect(lambda rows, elapsed: done.append(elapsed))
+    window.searchEdit.setText(text)
+    while not done:
+        app.processEvents()
+    window.search.resultsReady.disconnect()
+    window.search.resultsReady.connect(window.onSearchFinished)
+    return done[0]
+
+
+def wait_for_writes(app):
+    from writer import writer
+    while writer.pending:
+        app.processEvents(QEventLoop.WaitForMoreEvents)
+
+
+def open_database(path, profile=None):
+    from connections import connections
+    return connections.open(path, profile)
+
+
+def close_database():
+    from connections import connections
+    connections.close()
+
+
+def run_book(app, path, profile):
+    from validation import is_unique
+    from querylog import Query
+
+    results = {'database_mb': used_megabytes(path)}
+    conn = open_database(path, profile)
+
+    from main_window import MainWindow
+    from models import ContactsModel
+    window = MainWindow()
+    window.conn = conn
+
+    results['contacts_model_ms'] = timed(lambda: ContactsModel(window))
+    model = window.contactsModel.model
+    results['select_ms'] = timed(model.select)
+    results['first_page_ms'] = timed(lambda: (model.select(), model.row(0)))
+    results['middle_page_ms'] = timed(lambda: (model.select(), model.row(model.rowCount() // 2)))
+    # every page of the table read once
+    scan = Query()
+    results['scan_ms'] = timed(lambda: (scan.exec("SELECT sum(length(name) + length(job) + length(location)) "
+                                                  "FROM contacts"), scan.next()))
+    scan.finish()
+    del scan
+    # re-sorting reads the page shown with one indexed query
+    results['sort_job_desc_ms'] = timed(lambda: (model.sort(2, Qt.DescendingOrder), model.row(model.rowCount() // 2)))
+    model.sort(1, Qt.AscendingOrder)
+
+    rnd = random.Random(7)
+    samples = [model.record(rnd.randrange(model.rowCount())) for _ in range(REPEAT)]
+    for index, column in SEARCHES.items():
+        window.searchCombo.setCurrentIndex(index)
+        prefixes = [str(record.value(list(SEARCHES.values()).index(column) + 1))[:3] for record in samples]
+        # time from the last keystroke to the results, including the DEBOUNCE_MS pause
+        latencies = [wait_for_search(app, window, prefix) for prefix in prefixes]
+        results[f'search_{column}_latency_ms'] = round(statistics.median(latencies), 3)
+        window.searchEdit.setText('')
+    # the same prefix typed again is served by the result cache
+    window.searchCombo.setCurrentIndex(1)
+    wait_for_search(app, window, samples[0].value(1)[:3])
+    window.searchEdit.setText('')
+    results['search_repeat_latency_ms'] = round(wait_for_search(app, window, samples[0].value(1)[:3]), 3)
+    window.searchEdit.setText('')
+    window.searchCombo.setCurrentIndex(0)
+
+    from fuzzy import fuzzy_search
+    # one letter of each sampled name mistyped
+    typos = iter([record.value(1)[:1] + 'Q' + record.value(1)[2:] for record in samples])
+    results['fuzzy_search_ms'] = timed(lambda: fuzzy_search(conn, next(typos)))
+
+    contact = samples[0].value(4)
+    results['is_unique_hit_ms'] = timed(lambda: is_unique(contact, None))
+    results['is_unique_miss_ms'] = timed(lambda: is_unique('0000000000', None))
+
+    contacts = window.contactsModel
+    numbers = iter(range(1000000000, 2000000000))
+    # from the call to the model updated after the commit
+    results['add_ms'] = timed(lambda: (contacts.addContact(['BENCH MARK', 'TESTER', 'NOWHERE', str(next(numbers))]),
+                                       wait_for_writes(app)))
+    query_ids = [record.value(0) for record in samples]
+    updates = iter(query_ids)
+    results['update_ms'] = timed(lambda: (contacts.updateContact(
+        next(updates), ['BENCH UPDATED', 'TESTER', 'NOWHERE', str(next(numbers))]), wait_for_writes(app)))
+    removals = iter(query_ids)
+    results['remove_ms'] = timed(lambda: (contacts.removeContact(next(removals)), wait_for_writes(app)))
+
+    # writes queued faster than they commit share transactions
+    def burst():
+        for _ in range(BURST):
+            contacts.addContact(['BENCH BURST', 'TESTER', 'NOWHERE', str(next(numbers))])
+        wait_for_writes(app)
+    results['burst_adds_per_s'] = round(BURST * 1000 / timed(burst, 1))
+
+    from writer import writer
+    writer.close()
+
+    window.search.close()
+    window.deleteLater()
+    del window, model, contacts, samples, conn
+    app.processEvents()
+    gc.collect()
+    close_database()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='MyContacts benchmarks')
+    parser.add_argument('--rows', type=int, nargs='+', default=SIZES, help='book sizes (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=1975)
+    parser.add_argument('--workdir', default=tempfile.gettempdir(), help='where generated books are kept')
+    parser.add_argument('--output', help='JSON file for the results (default: stdout)')
+    parser.add_argument('--names', choices=('realistic', 'random'), default='realistic',
+                        help='common first names and surnames, or random letters (default: %(default)s)')
+    parser.add_argument('--profile', nargs='+', default=['durable'], choices=PROFILES,
+                        help='storage profiles to compare, see connections.PROFILES (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    app = QApplication([])
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'pyside': PySide6.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'results': {},
+    }
+    for rows in args.rows:
+        source = book(args.workdir, rows, args.seed, args.names)
+        for profile in args.profile:
+            # the write benchmarks change the book, so every run starts from a fresh copy
+            path = source.replace('.sqlite', '-run.sqlite')
+            shutil.copyfile(source, path)
+            print(f'{rows} rows, {profile}...', file=sys.stderr)
+            key = str(rows) if profile == 'durable' else f'{rows} {profile}'
+            report['results'][key] = run_book(app, path, profile)
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,18 +20,17 @@
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QIcon
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QFormLayout,
-                               QLabel, QLineEdit, QPushButton)
+                               QLabel, QLineEdit, QPushButton, QMessageBox)
 
-from models import UsersModel
+from models import users
 from module import custom_font
 
 
 class ChangePassword(QDialog):
-    def __init__(self, rec_no, parent=None):
+    def __init__(self, username, parent=None):
         super().__init__(parent=parent)
         self.parent = parent
-        self.usersModel = UsersModel(self)
-        self.rec_no = rec_no
+        self.username = username
         self.setWindowIcon(QIcon('icons/app32.png'))
         self.setWindowTitle('Contacts Book')
         self.setStyleSheet("background-color: rgb(100, 200, 200)")
@@ -121,9 +120,7 @@ class ChangePassword(QDialog):
 
     def onSubmit(self):
         self.msg = ''
-        self.model = self.usersModel.model
-        record = self.model.record(self.rec_no)
-        pwd = record.field(2).value()
+        pwd = users.find(self.username)[2]
         current_password = self.edit_current_password.text().strip()
         new_password = self.edit_new_password.text().strip()
         confirm_password = self.edit_confirm_password.text().strip()
@@ -145,7 +142,7 @@ class ChangePassword(QDialog):
             self.edit_new_password.setFocus()
 
         else:
-            self.usersModel.changePassword(self.rec_no, new_password)
+            users.changePassword(self.username, new_password, self.onPasswordChanged)
             self.close()
 
         self.label_error_msg.setText(self.msg)
@@ -154,6 +151,12 @@ class ChangePassword(QDialog):
         self.edit_new_password.setText('')
         self.edit_confirm_password.setText('')
 
+    def onPasswordChanged(self, done):
+        if done:
+            QMessageBox.information(self.parent, 'Change Password', 'Password has been changed successfully')
+        else:
+            QMessageBox.critical(self.parent, 'Change Password', 'Error!!! Could not Change Password')
+
     def onTextChange(self, text):
         if text:
             self.label_error_msg.hide()
@@ -0,0 +1,174 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+from PySide6.QtCore import QThread
+from PySide6.QtSql import QSqlDatabase
+
+from querylog import Query
+
+# Connections to the contacts database. A QSqlDatabase may only be used by the
+# thread that owns it: the GUI thread has the default connection, any other
+# thread borrows a named one with connections.connection() and has it to itself
+# until it gives it back. Connections given back are parked without a thread,
+# up to POOL_SIZE, and the next thread to ask adopts one instead of opening the
+# file again. Every connection is set up alike, by the storage profile.
+
+POOL_SIZE = 4               # idle connections kept open
+BUSY_TIMEOUT_MS = 5000      # how long a statement waits for the write of another connection
+
+# Storage profiles, chosen with MYCONTACTS_STORAGE_PROFILE; cache_size is in KB when negative.
+PROFILES = {
+    # Rollback journal synced on every commit. Nothing committed is lost on a power
+    # failure and it is the only mode safe for a book on a network share, but every
+    # write pays for a sync and readers wait while a write commits.
+    'durable': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'cache_size': -16384,
+                'mmap_size': 0, 'temp_store': 'DEFAULT'},
+    # Write-ahead log synced only at checkpoints. Readers never wait for the writer and
+    # a commit costs no sync; a power failure may take the last commits back, but never
+    # corrupts the book. The log needs shared memory, so the book must be on a local disk.
+    'balanced': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -16384,
+                 'mmap_size': 0, 'temp_store': 'MEMORY'},
+    # Balanced with a 64 MB cache per connection and the file mapped into memory, so
+    # that reads copy nothing. For large read-mostly books; it costs memory, and an I/O
+    # error while reading crashes the application instead of failing the query.
+    'fast-read': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -65536,
+                  'mmap_size': 1 << 30, 'temp_store': 'MEMORY'},
+}
+PROFILE = os.environ.get('MYCONTACTS_STORAGE_PROFILE', 'durable')
+
+
+class ProfileError(Exception):
+    pass
+
+
+class ConnectionManager:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = None
+        self.profile = PROFILE
+        self.opened = 0             # named connections opened so far
+        self.idle = []              # open connections without a thread
+        self.held = {}              # thread id -> [connection, times acquired]
+
+    def open(self, path, profile=None):
+        # the default connection, for the GUI thread; the others open the same file
+        if profile is not None:
+            self.profile = profile
+        if self.profile not in PROFILES:
+            # a misspelt name would otherwise fail on the first PRAGMA, or pass for another profile
+            raise ProfileError(f"Unknown storage profile '{self.profile}' in MYCONTACTS_STORAGE_PROFILE, "
+                               f"use one of: {', '.join(PROFILES)}")
+        self.path = path
+        conn = QSqlDatabase.addDatabase("QSQLITE")
+        conn.setDatabaseName(path)
+        if conn.open():
+            # kept in the file, the connections opened later find it set; leaving WAL
+            # fails quietly while another process has the book open
+            query = Query(conn)
+            query.exec(f"PRAGMA journal_mode = {PROFILES[self.profile]['journal_mode']}")
+            query.finish()
+            self.configure(conn)
+        return conn
+
+    def configure(self, conn):
+        query = Query(conn)
+        query.exec(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        for pragma in ('synchronous', 'cache_size', 'mmap_size', 'temp_store'):
+            query.exec(f'PRAGMA {pragma} = {PROFILES[self.profile][pragma]}')
+        query.finish()
+
+    def acquire(self):
+        # the calling thread's connection, check isOpen() before use
+        key = threading.get_ident()
+        with self.lock:
+            held = self.held.get(key)
+            if held is not None:
+                held[1] += 1
+                return held[0]
+            conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                self.opened += 1
+                name = f'contacts-{self.opened}'
+
+        if conn is not None:
+            conn.moveToThread(QThread.currentThread())
+        else:
+            conn = QSqlDatabase.addDatabase("QSQLITE", name)
+            conn.setDatabaseName(self.path)
+            if conn.open():
+                self.configure(conn)
+        with self.lock:
+            self.held[key] = [conn, 1]
+        return conn
+
+    def release(self, conn):
+        # by the thread that acquired it, once its queries are gone
+        key = threading.get_ident()
+        with self.lock:
+            held = self.held[key]
+            held[1] -= 1
+            if held[1]:
+                return
+            del self.held[key]
+
+        if conn.isOpen() and conn.moveToThread(None):
+            with self.lock:
+                self.idle.append(conn)
+                if len(self.idle) <= POOL_SIZE:
+                    return
+                # the least recently used one goes, nothing else refers to it
+                conn = self.idle.pop(0)
+            conn.moveToThread(QThread.currentThread())
+        name = conn.connectionName()
+        conn.close()
+        del conn
+        QSqlDatabase.removeDatabase(name)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        # on exit, once the threads that borrowed connections have given them back
+        with self.lock:
+            idle = self.idle
+            self.idle = []
+        while idle:
+            conn = idle.pop()
+            conn.moveToThread(QThread.currentThread())
+            name = conn.connectionName()
+            conn.close()
+            del conn
+            QSqlDatabase.removeDatabase(name)
+
+        conn = QSqlDatabase.database(QSqlDatabase.defaultConnection, False)
+        conn.close()
+        del conn
+        QSqlDatabase.removeDatabase(QSqlDatabase.defaultConnection)
+
+
+connections = ConnectionManager()
@@ -22,7 +22,8 @@ from PySide6.QtGui import QIntValidator, QIcon
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QFormLayout,
                                QLineEdit, QDialogButtonBox, QApplication, QLabel)
 
-from module import valid_space, min_length, alpha_or_space, is_unique, custom_font
+from module import custom_font
+from validation import CONTACT, is_unique
 
 
 class MangeDialog(QDialog):
@@ -147,87 +148,108 @@ class MangeDialog(QDialog):
         else:
             self.buttonsBox.button(QDialogButtonBox.Ok).setEnabled(False)
 
-    def show_error(self, error_type, widget, min_len=None, name=None):
-        error_msg = ''
-        if error_type == 'alpha_space_error':
-            error_msg = f'\t{widget.objectName()} field accepts only alphabets and space(s)'
-
-        elif error_type == 'space_error':
-            error_msg = '\tTwo or more continuous spaces are not allowed in {widget.objectName()} field'
-
-        elif error_type == 'length_error':
-            error_msg = f'\tMinimum {min_len} characters required for {widget.objectName()} field'
-
-        elif error_type == 'unique_error':
-            error_msg = f'\tContact number {widget.text()} used by {name}'
-
-        self.errorLabel.setText(f'{error_msg}')
+    def show_error(self, error_msg, widget):
+        self.errorLabel.setText(f'\t{error_msg}')
         self.errorLabel.setVisible(True)
         widget.setFocus()
 
     def accept(self):
-        sender = self.sender()
-        name = self.nameEdit.text().strip()
-        job = self.jobEdit.text().strip()
-        location = self.locationEdit.text().strip()
-        contact_number = self.contactEdit.text().strip()
-
-        # validate name
-        if not alpha_or_space(name):
-            self.show_error('alpha_space_error', self.nameEdit)
+        data, errors = CONTACT.validate([widget.text() for widget in self.line_edits])
+        if errors:
+            # fields are checked in the order of the form, the first error is shown
+            edits = dict(zip((field.name for field in CONTACT.fields), self.line_edits))
+            self.show_error(errors[0].message, edits[errors[0].field])
             return False
 
-        elif not valid_space(name):
-            self.show_error('space_error', self.nameEdit)
-            return False
+        if self.record is None:
+            person_id = None
+        else:
+            person_id = self.record.field(0).value()
 
-        elif not min_length(len(name), 3):
-            self.show_error('length_error', self.nameEdit, 3)
+        result = is_unique(data[3], person_id)
+        if not result[0]:
+            self.show_error(f'Contact number {data[3]} used by {result[1]}', self.contactEdit)
             return False
 
-        # validate job
-        if not alpha_or_space(job):
-            self.show_error('alpha_space_error', self.jobEdit)
-            return False
+        self.data = data
+        super().accept()
 
-        elif not valid_space(job):
-            self.show_error('space_error', self.jobEdit)
-            return False
 
-        elif not min_length(len(job), 3):
-            self.show_error('length_error', self.jobEdit, 3)
-            return False
+class BatchEditDialog(QDialog):
+    # sets job and/or location on several contacts at once, empty fields are left unchanged
+    def __init__(self, parent, count):
+        super().__init__(parent=parent)
+        self.parent = parent
+        self.data = None
+        self.resize(int(self.parent.width() * .4), int(self.parent.height() * .3))
+        self.setWindowModality(Qt.WindowModal)
+        self.setWindowTitle(f"Update {count} Contacts")
+        self.setStyleSheet("background-color: rgb(150, 200, 125)")
+        self.main_layout = QVBoxLayout()
+        self.setLayout(self.main_layout)
 
-        # validate location
-        if not alpha_or_space(location):
-            self.show_error('alpha_space_error', self.locationEdit)
-            return False
+        self.jobEdit = QLineEdit()
+        self.jobEdit.setPlaceholderText('Leave empty to keep the occupation')
+        self.jobEdit.setObjectName("Job")
+        self.jobEdit.setMaxLength(20)
 
-        elif not valid_space(location):
-            self.show_error('space_error', self.locationEdit)
-            return False
+        self.locationEdit = QLineEdit()
+        self.locationEdit.setPlaceholderText('Leave empty to keep the location')
+        self.locationEdit.setObjectName("Location")
+        self.locationEdit.setMaxLength(20)
 
-        elif not min_length(len(location), 3):
-            self.show_error('length_error', self.locationEdit, 3)
-            return False
+        self.errorLabel = QLabel()
+        self.errorLabel.setAlignment(Qt.AlignCenter)
+        self.errorLabel.setStyleSheet('color: rgb(255, 0, 0)')
+        custom_font(self.errorLabel, font_size=12, bold=False)
+        self.errorLabel.setWordWrap(True)
+        self.errorLabel.setVisible(False)
 
-        # validate contact
-        if not min_length(len(contact_number), 10):
-            self.show_error('length_error', self.contactEdit, 10)
-            return False
+        form_layout = QFormLayout()
+        form_layout.setHorizontalSpacing(30)
+        form_layout.setVerticalSpacing(20)
+        form_layout.addRow("&Job", self.jobEdit)
+        form_layout.addRow("&Location", self.locationEdit)
 
-        if self.record is None:
-            person_id = None
-        else:
-            person_id = self.record.field(0).value()
+        self.buttonsBox = QDialogButtonBox()
+        self.buttonsBox.setOrientation(Qt.Horizontal)
+        self.buttonsBox.setStandardButtons(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        self.buttonsBox.setStyleSheet('background-color: rgba(150, 150, 150, 1)')
+        self.buttonsBox.accepted.connect(self.accept)
+        self.buttonsBox.rejected.connect(self.reject)
 
-        result = is_unique(contact_number, person_id)
-        if not result[0]:
-            self.show_error('unique_error', self.contactEdit, name=result[1])
-            return False
+        self.main_layout.addLayout(form_layout)
+        self.main_layout.addStretch()
+        self.main_layout.addWidget(self.errorLabel)
+        self.main_layout.addWidget(self.buttonsBox)
 
-        self.data = []
-        for index, widget in enumerate(self.line_edits):
-            self.data.append(widget.text().strip().upper())
+        for widget in (self.jobEdit, self.locationEdit):
+            widget.setStyleSheet('background-color: rgb(245, 245, 245)')
+            widget.textChanged.connect(lambda: self.errorLabel.setVisible(False))
+        self.jobEdit.setFocus()
+
+    def show_error(self, error_msg, widget):
+        self.errorLabel.setText(f'\t{error_msg}')
+        self.errorLabel.setVisible(True)
+        widget.setFocus()
+
+    def accept(self):
+        values = []
+        for widget in (self.jobEdit, self.locationEdit):
+            field = CONTACT.field(widget.objectName().lower())
+            text = field.clean(widget.text())
+            if not text:
+                values.append(None)
+                continue
+            error = field.check(text)
+            if error is not None:
+                self.show_error(error[1], widget)
+                return False
+            values.append(text)
+
+        if values == [None, None]:
+            self.show_error('Enter a job and/or a location', self.jobEdit)
+            return False
 
+        self.data = values
         super().accept()
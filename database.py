@@ -17,18 +17,30 @@
     along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from PySide6.QtSql import QSqlQuery
+import re
+
+from PySide6.QtSql import QSqlDatabase
+
+from querylog import Query
+
+
+MAX_TRIGRAMS = 64          # longer names are indexed on their first 64 characters
+MAX_CHANGES = 10000        # entries kept in contact_changes, older ones are trimmed
+
+
+class MigrationError(Exception):
+    pass
 
 
 def createTables():
-    query = QSqlQuery()
+    query = Query()
     query.exec_("""
             CREATE TABLE IF NOT EXISTS contacts(
-            id INTEGER PRIMARY KEY AUTOINCREMENT UNIQUE NOT NULL,
+            id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
             name       VARCHAR(30)  NOT NULL,
             job        VARCHAR(20)  NOT NULL,
             location   VARCHAR(20)  NOT NULL,
-            contact    CHAR(10)     NOT NULL)
+            contact    INTEGER      NOT NULL)
         """)
 
     query.finish()
@@ -42,7 +54,469 @@ def createTables():
 
     query.finish()
 
+    migrate()
+    if not tableExists('contacts_fts'):
+        db = QSqlDatabase.database()
+        db.transaction()
+        try:
+            createFullTextIndex()
+        except MigrationError:
+            db.rollback()
+            raise
+        db.commit()
+    return createUniqueIndex()
+
+
+def execute(sql, conn=None):
+    # on the default connection unless the connection of another thread is given
+    query = Query() if conn is None else Query(conn)
+    if not query.exec(sql):
+        raise MigrationError(query.lastError().text())
+    query.finish()
+
+
+def schemaVersion():
+    query = Query('PRAGMA user_version')
+    version = query.value(0) if query.next() else 0
+    query.finish()
+    return version
+
+
+# schema migrations, applied in order; the list index + 1 is the schema version
+def addSearchIndexes():
+    # NOCASE so that the case insensitive "like 'text%'" filters can use them
+    execute("CREATE INDEX IF NOT EXISTS idx_contacts_name ON contacts(name COLLATE NOCASE)")
+    execute("CREATE INDEX IF NOT EXISTS idx_contacts_job ON contacts(job COLLATE NOCASE)")
+    execute("CREATE INDEX IF NOT EXISTS idx_contacts_location ON contacts(location COLLATE NOCASE)")
+
+
+def addContactIndex():
+    # unique when possible, see createUniqueIndex()
+    if findDuplicateContacts():
+        execute("CREATE INDEX IF NOT EXISTS idx_contacts_contact ON contacts(contact)")
+    else:
+        execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_contacts_contact ON contacts(contact)")
+
+
+def addFullTextIndex():
+    createFullTextIndex()
+
+
+def createFullTextIndex():
+    # The "all fields" search needs FTS5. A SQLite built without it leaves the index out
+    # and the search is shown as unavailable; createTables() tries again on every start,
+    # so the index is built once SQLite supports it.
+    if tableExists('contacts_fts'):
+        return True
+    query = Query()
+    if not query.exec("""
+                CREATE VIRTUAL TABLE contacts_fts USING fts5(
+                name, job, location, contact,
+                content='contacts_fts_source', content_rowid='id', prefix='2 3')
+            """):
+        return False
+
+    createFullTextSource()
+    createFullTextTriggers()
+    execute("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')")
+    return True
+
+
+def createFullTextSource():
+    # the indexed columns, with the contact number as its 10 digits, see contactText()
+    execute(f"""
+            CREATE VIEW IF NOT EXISTS contacts_fts_source AS
+            SELECT id, name, job, location, {contactText()} AS contact FROM contacts
+        """)
+
+
+def createFullTextTriggers(conn=None):
+    execute(f"""
+            CREATE TRIGGER IF NOT EXISTS contacts_fts_insert AFTER INSERT ON contacts BEGIN
+                INSERT INTO contacts_fts(rowid, name, job, location, contact)
+                VALUES (new.id, new.name, new.job, new.location, {contactText('new.')});
+            END
+        """, conn)
+    execute(f"""
+            CREATE TRIGGER IF NOT EXISTS contacts_fts_delete AFTER DELETE ON contacts BEGIN
+                INSERT INTO contacts_fts(contacts_fts, rowid, name, job, location, contact)
+                VALUES ('delete', old.id, old.name, old.job, old.location, {contactText('old.')});
+            END
+        """, conn)
+    execute(f"""
+            CREATE TRIGGER IF NOT EXISTS contacts_fts_update AFTER UPDATE ON contacts BEGIN
+                INSERT INTO contacts_fts(contacts_fts, rowid, name, job, location, contact)
+                VALUES ('delete', old.id, old.name, old.job, old.location, {contactText('old.')});
+                INSERT INTO contacts_fts(rowid, name, job, location, contact)
+                VALUES (new.id, new.name, new.job, new.location, {contactText('new.')});
+            END
+        """, conn)
+
+
+# trigrams of ' NAME ', one per character of the name, see fuzzy.trigrams()
+def trigramSelect(name, extra=''):
+    return f"SELECT substr(' ' || upper({name}) || ' ', n, 3){extra} FROM trigram_positions WHERE n <= length({name})"
+
+
+def addTrigramIndex():
+    # postings of the name trigrams, fuzzy.fuzzy_search() counts the ones a name shares with the search text.
+    # Similarity only depends on the name, so each distinct name (in any case) is indexed once, in contact_names.
+    execute("CREATE TABLE IF NOT EXISTS trigram_positions(n INTEGER PRIMARY KEY)")
+    execute(f"""
+            INSERT OR IGNORE INTO trigram_positions(n)
+            WITH RECURSIVE positions(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM positions WHERE n < {MAX_TRIGRAMS})
+            SELECT n FROM positions
+        """)
+    execute("""
+            CREATE TABLE IF NOT EXISTS contact_names(
+            id    INTEGER  PRIMARY KEY,
+            name  TEXT     NOT NULL UNIQUE COLLATE NOCASE)
+        """)
+    execute("""
+            CREATE TABLE IF NOT EXISTS name_trigrams(
+            trigram  TEXT     NOT NULL,
+            name_id  INTEGER  NOT NULL,
+            PRIMARY KEY(trigram, name_id)) WITHOUT ROWID
+        """)
+
+    createTrigramTriggers()
+
+    execute("DELETE FROM name_trigrams")
+    execute("DELETE FROM contact_names")
+    execute("INSERT OR IGNORE INTO contact_names(name) SELECT name FROM contacts")
+    execute("""
+            INSERT OR IGNORE INTO name_trigrams(trigram, name_id)
+            SELECT substr(' ' || upper(name) || ' ', n, 3), id
+            FROM contact_names JOIN trigram_positions ON n <= length(name)
+        """)
+
+
+def createTrigramTriggers(conn=None):
+    # a name is indexed with its first contact and dropped with its last one
+    name_id = "(SELECT id FROM contact_names WHERE name = {})"
+    unused = "NOT EXISTS (SELECT 1 FROM contacts WHERE name = old.name COLLATE NOCASE)"
+    insert = (f"INSERT OR IGNORE INTO contact_names(name) VALUES (new.name); "
+              f"INSERT OR IGNORE INTO name_trigrams(trigram, name_id) "
+              f"{trigramSelect('new.name', ', ' + name_id.format('new.name'))};")
+    delete = (f"DELETE FROM name_trigrams WHERE {unused} AND name_id = {name_id.format('old.name')} "
+              f"AND trigram IN ({trigramSelect('old.name')}); "
+              f"DELETE FROM contact_names WHERE {unused} AND name = old.name;")
+    execute(f"CREATE TRIGGER IF NOT EXISTS name_trigrams_insert AFTER INSERT ON contacts BEGIN {insert} END", conn)
+    execute(f"CREATE TRIGGER IF NOT EXISTS name_trigrams_delete AFTER DELETE ON contacts BEGIN {delete} END", conn)
+    execute(f"""
+            CREATE TRIGGER IF NOT EXISTS name_trigrams_update AFTER UPDATE OF name ON contacts
+            WHEN old.name IS NOT new.name BEGIN {delete} {insert} END
+        """, conn)
+
+
+def addUsernameIndex():
+    # logins look users up by name; should a name have been stored twice, the oldest account
+    # keeps it and the others are renamed to name-id, so that no account is lost
+    execute("UPDATE users SET username = username || '-' || id "
+            "WHERE id NOT IN (SELECT min(id) FROM users GROUP BY username)")
+    execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username)")
+
+
+def columnType(table, column):
+    query = Query(f'PRAGMA table_info({table})')
+    declared = None
+    while query.next():
+        if query.value(1) == column:
+            declared = query.value(2)
+    query.finish()
+    return declared
+
+
+def compactContacts():
+    # Contact numbers become integers: 6 bytes instead of 10 characters in the table and in
+    # idx_contacts_contact, compared as numbers, and a prefix search is a range of them. The
+    # UNIQUE of the id column, a second index on the primary key, goes too. SQLite cannot
+    # change the type of a column, so the table is copied and its indexes and triggers put back.
+    if columnType('contacts', 'contact') == 'INTEGER':
+        return
+    execute("""
+            CREATE TABLE contacts_compact(
+            id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+            name       VARCHAR(30)  NOT NULL,
+            job        VARCHAR(20)  NOT NULL,
+            location   VARCHAR(20)  NOT NULL,
+            contact    INTEGER      NOT NULL)
+        """)
+    # ids of removed contacts are not given again: the high-water mark goes over with the rows
+    execute("""
+            INSERT INTO sqlite_sequence(name, seq)
+            SELECT 'contacts_compact', seq FROM sqlite_sequence WHERE name = 'contacts'
+        """)
+    # the column affinity turns every number into an integer, anything else stays text
+    execute("""
+            INSERT INTO contacts_compact(id, name, job, location, contact)
+            SELECT id, name, job, location, trim(contact) FROM contacts
+        """)
+    # a view of the table would fail the rename
+    source = tableExists('contacts_fts_source')
+    execute("DROP VIEW IF EXISTS contacts_fts_source")
+    execute("DROP TABLE contacts")
+    execute("ALTER TABLE contacts_compact RENAME TO contacts")
+
+    addSearchIndexes()
+    addContactIndex()
+    if source:
+        createFullTextSource()
+    if tableExists('contacts_fts'):
+        createFullTextTriggers()
+    if tableExists('name_trigrams'):
+        createTrigramTriggers()
+
+
+def addChangeLog():
+    # Every change to a contact, by this or any other process, gets an entry with
+    # a sequence number and the row as it was before (NULL for an insert). An
+    # instance that has seen the changes up to some number reads the entries
+    # after it and patches its model, see ContactsTableModel.applyChanges().
+    # The triggers trim the log themselves; an instance that fell further behind
+    # than MAX_CHANGES reads the whole table again.
+    execute("""
+            CREATE TABLE IF NOT EXISTS contact_changes(
+            seq         INTEGER  PRIMARY KEY AUTOINCREMENT,
+            contact_id  INTEGER  NOT NULL,
+            name        VARCHAR(30),
+            job         VARCHAR(20),
+            location    VARCHAR(20),
+            contact     INTEGER)
+        """)
+    createChangeLogTriggers()
+
+
+def createChangeLogTriggers(conn=None):
+    execute("""
+            CREATE TRIGGER IF NOT EXISTS contact_changes_insert AFTER INSERT ON contacts BEGIN
+                INSERT INTO contact_changes(contact_id) VALUES (new.id);
+            END
+        """, conn)
+    execute("""
+            CREATE TRIGGER IF NOT EXISTS contact_changes_delete AFTER DELETE ON contacts BEGIN
+                INSERT INTO contact_changes(contact_id, name, job, location, contact)
+                VALUES (old.id, old.name, old.job, old.location, old.contact);
+            END
+        """, conn)
+    execute("""
+            CREATE TRIGGER IF NOT EXISTS contact_changes_update AFTER UPDATE ON contacts BEGIN
+                INSERT INTO contact_changes(contact_id, name, job, location, contact)
+                VALUES (old.id, old.name, old.job, old.location, old.contact);
+                INSERT INTO contact_changes(contact_id) SELECT new.id WHERE new.id IS NOT old.id;
+            END
+        """, conn)
+    execute(f"""
+            CREATE TRIGGER IF NOT EXISTS contact_changes_trim AFTER INSERT ON contact_changes
+            WHEN new.seq % 1000 = 0 BEGIN
+                DELETE FROM contact_changes WHERE seq <= new.seq - {MAX_CHANGES};
+            END
+        """, conn)
+
+
+def indexDistinctNames():
+    # name_trigrams used to have the postings of every contact, which made names
+    # common in the book slow to search; it is built again over contact_names
+    if columnType('name_trigrams', 'name_id') is not None:
+        return
+    for trigger in ('name_trigrams_insert', 'name_trigrams_delete', 'name_trigrams_update'):
+        execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    execute("DROP TABLE IF EXISTS name_trigrams")
+    addTrigramIndex()
+
+
+def indexContactText():
+    # the full-text index had contact numbers as integers, without their leading
+    # zeros; it is built again over contacts_fts_source
+    if not tableExists('contacts_fts') or tableExists('contacts_fts_source'):
+        return
+    for trigger in ('contacts_fts_insert', 'contacts_fts_delete', 'contacts_fts_update'):
+        execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    execute("DROP TABLE contacts_fts")
+    createFullTextIndex()
+
+
+MIGRATIONS = [
+    addSearchIndexes,
+    addContactIndex,
+    addFullTextIndex,
+    addTrigramIndex,
+    addUsernameIndex,
+    compactContacts,
+    addChangeLog,
+    indexDistinctNames,
+    indexContactText,
+]
+
+
+def migrate():
+    db = QSqlDatabase.database()
+    version = schemaVersion()
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        db.transaction()
+        try:
+            step()
+            execute(f'PRAGMA user_version = {number}')
+        except MigrationError:
+            db.rollback()
+            raise
+        db.commit()
+
+
+def tableExists(name, conn=None):
+    query = Query() if conn is None else Query(conn)
+    query.prepare("SELECT 1 FROM sqlite_master WHERE name = ?")
+    query.addBindValue(name)
+    query.exec()
+    exists = query.next()
+    query.finish()
+    return exists
+
+
+INSERT_TRIGGERS = ('contacts_fts_insert', 'name_trigrams_insert', 'contact_changes_insert')
+
+
+def startBulkInsert(conn):
+    # For many inserts in one transaction of conn, e.g. an import: the insert
+    # triggers are dropped and finishBulkInsert() indexes the new contacts with a
+    # statement per index, then puts the triggers back. Other connections see
+    # neither, both happen before the commit. Returns the ids the new rows follow.
+    for trigger in INSERT_TRIGGERS:
+        execute(f"DROP TRIGGER IF EXISTS {trigger}", conn)
+    query = Query(conn)
+    query.exec("SELECT (SELECT coalesce(max(id), 0) FROM contacts), (SELECT coalesce(max(id), 0) FROM contact_names)")
+    query.next()
+    last = (query.value(0), query.value(1))
+    query.finish()
+    return last
+
+
+def finishBulkInsert(conn, last):
+    last_id, last_name_id = last
+    if tableExists('contacts_fts', conn):
+        execute(f"""
+                INSERT INTO contacts_fts(rowid, name, job, location, contact)
+                SELECT id, name, job, location, contact FROM contacts_fts_source WHERE id > {last_id}
+            """, conn)
+        createFullTextTriggers(conn)
+    execute(f"INSERT OR IGNORE INTO contact_names(name) SELECT name FROM contacts WHERE id > {last_id}", conn)
+    execute(f"""
+            INSERT OR IGNORE INTO name_trigrams(trigram, name_id)
+            SELECT substr(' ' || upper(name) || ' ', n, 3), id
+            FROM contact_names JOIN trigram_positions ON n <= length(name) WHERE id > {last_name_id}
+        """, conn)
+    createTrigramTriggers(conn)
+    # one entry for all the new contacts, a number past the next one: the other
+    # instances find the log broken and read the whole table again
+    execute(f"""
+            INSERT INTO contact_changes(seq, contact_id)
+            SELECT coalesce((SELECT seq FROM sqlite_sequence WHERE name = 'contact_changes'), 0) + 2, 0
+            WHERE EXISTS (SELECT 1 FROM contacts WHERE id > {last_id})
+        """, conn)
+    createChangeLogTriggers(conn)
+
+
+def findDuplicateContacts():
+    duplicates = []
+    query = Query()
+    query.exec(f"""
+                SELECT {contactText()}, group_concat(name, ', ') FROM contacts
+                GROUP BY contact HAVING count(*) > 1
+            """)
+    while query.next():
+        duplicates.append((query.value(0), query.value(1)))
+
+    query.finish()
+    return duplicates
+
+
+def createUniqueIndex():
+    # contact numbers are looked up by validation.is_unique on every add/update
+    query = Query()
+    query.exec("PRAGMA index_list(contacts)")
+    unique = False
+    while query.next():
+        if query.value(1) == 'idx_contacts_contact':
+            unique = bool(query.value(2))
+    query.finish()
+    if unique:
+        return []
+
+    duplicates = findDuplicateContacts()
+    if duplicates:
+        return duplicates
+
+    execute("DROP INDEX IF EXISTS idx_contacts_contact")
+    execute("CREATE UNIQUE INDEX idx_contacts_contact ON contacts(contact)")
+    return []
+
+
+def contactText(table=''):
+    # contact numbers are stored as integers, see compactContacts(), and read back as their 10 digits
+    contact = f'{table}contact'
+    return f"CASE typeof({contact}) WHEN 'integer' THEN printf('%010d', {contact}) ELSE {contact} END"
+
+
+def contactColumns(table=''):
+    # the select list of a contact row, (id, name, job, location, contact)
+    return f"{table}id, {table}name, {table}job, {table}location, {contactText(table)}"
+
+
+SORT_COLUMNS = ('id', 'name', 'job', 'location', 'contact')     # by table column
+
+
+def ftsPattern(text):
+    # every word typed is a token prefix, all of them must match
+    tokens = re.findall(r'\w+', text)
+    return ' '.join(f'"{token}"*' for token in tokens) or None
+
+
+def searchCondition(column, text):
+    if column == 'all':
+        pattern = ftsPattern(text)
+        if pattern is None:
+            return "0", None
+        return "id IN (SELECT rowid FROM contacts_fts WHERE contacts_fts MATCH :pattern)", pattern
+    # the numbers of 10 digits that start with the text typed, a range of idx_contacts_contact
+    if column == 'contact' and text.isascii() and text.isdigit():
+        if len(text) > 10:
+            return "0", None
+        scale = 10 ** (10 - len(text))
+        return f"contact >= :pattern AND contact < :pattern + {scale}", int(text) * scale
+    pattern = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"{column} LIKE :pattern ESCAPE '\\'", pattern + '%'
+
+
+def sortExpression(column, table=''):
+    # collations match the indexes, see addSearchIndexes() and addContactIndex()
+    collation = ' COLLATE NOCASE' if column in ('name', 'job', 'location') else ''
+    return f'{table}{column}{collation}'
+
+
+def orderBy(column, descending=False, table=''):
+    # every sort key has an index to walk, id breaks ties so that keyset pagination has a total order
+    direction = ' DESC' if descending else ''
+    if column == 'id':
+        return f'{table}id{direction}'
+    return f'{sortExpression(column, table)}{direction}, {table}id{direction}'
 
 
+def keysetCondition(column, descending=False):
+    # rows after (:value, :id) in orderBy(column, descending), written so that the index range starts there
+    after = '<' if descending else '>'
+    if column == 'id':
+        return f'id {after} :id'
+    expression = sortExpression(column)
+    return f'{expression} {after}= :value AND ({expression} {after} :value OR id {after} :id)'
 
 
+def searchQuery(column, text, sort=None, descending=False):
+    # full text matches are ranked, everything else is listed by name unless a sort column is given
+    if column == 'all':
+        order = orderBy(sort, descending, 'contacts.') if sort else 'contacts_fts.rank'
+        return (f"SELECT {contactColumns('contacts.')} FROM contacts_fts "
+                "JOIN contacts ON contacts.id = contacts_fts.rowid "
+                f"WHERE contacts_fts MATCH :pattern ORDER BY {order}", ftsPattern(text))
+    condition, pattern = searchCondition(column, text)
+    return (f"SELECT {contactColumns()} FROM contacts WHERE {condition} "
+            f"ORDER BY {orderBy(sort or 'name', descending)}", pattern)
@@ -0,0 +1,215 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from PySide6.QtCore import QObject, Signal, Slot
+
+from connections import connections
+from database import contactColumns, contactText
+from querylog import Query
+from validation import NON_DIGITS
+
+# Whole book duplicate detection. Every contact gets normalized blocking keys;
+# contacts whose keys hash alike are candidates, joined into groups with a
+# union-find, so one pass over the table and a dict lookup per key replace
+# comparing every pair. The few candidates are then read back and grouped
+# again on the exact keys, which also discards hash collisions.
+
+ID_RANGE = 50000            # ids read by one query, as a single group_concat() string
+MEMBERS_QUERY = 500         # ids looked up by one "IN (...)" query
+REASONS = ('same number', 'same name and location')
+
+
+def name_key(text):
+    # single spaces and upper case, as MangeDialog stores names
+    return ' '.join(text.split()).upper()
+
+
+def contact_key(contact):
+    # canonical digits: formatting and any country or trunk prefix dropped
+    digits = contact if contact.isdecimal() else NON_DIGITS.sub('', contact)
+    return digits[-10:]
+
+
+def block_keys(name, location, contact):
+    # the same number, or the same name, words in any order, at the same location;
+    # a key is None when there is nothing to compare
+    words = sorted(name_key(name).split())
+    return contact_key(contact) or None, f"{' '.join(words)}\x1f{name_key(location)}" if words else None
+
+
+class Groups:
+    # union-find over contact ids
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, rec_id):
+        parent = self.parent.setdefault(rec_id, rec_id)
+        while parent != rec_id:
+            grandparent = self.parent[parent]
+            self.parent[rec_id] = grandparent
+            rec_id, parent = parent, grandparent
+        return rec_id
+
+    def union(self, rec_id, other):
+        self.parent[self.find(other)] = self.find(rec_id)
+
+    def groups(self):
+        members = {}
+        for rec_id in self.parent:
+            members.setdefault(self.find(rec_id), []).append(rec_id)
+        return [sorted(ids) for ids in members.values() if len(ids) > 1]
+
+
+def candidate_ids(conn, progress=None, cancelled=None):
+    # ids sharing the hash of a blocking key with an earlier contact
+    query = Query(conn)
+    query.exec("SELECT min(id), max(id) FROM contacts")
+    query.next()
+    # QSQLITE reads the NULLs of an empty table as empty strings
+    empty = query.isNull(0)
+    low, high = query.value(0), query.value(1)
+    query.finish()
+    if empty:
+        return []
+
+    # the separators become spaces, which the keys ignore anyway
+    query.prepare(f"""
+            SELECT group_concat(id || char(31) || replace(replace(name, char(30), ' '), char(31), ' ')
+                                || char(31) || replace(replace(location, char(30), ' '), char(31), ' ')
+                                || char(31) || replace(replace({contactText()}, char(30), ''), char(31), ''), char(30))
+            FROM contacts WHERE id >= ? AND id < ?
+        """)
+    first = [{}, {}]            # per kind of key: hash -> first id
+    groups = Groups()
+    for start in range(low, high + 1, ID_RANGE):
+        if cancelled is not None and cancelled():
+            return []
+        query.addBindValue(start)
+        query.addBindValue(start + ID_RANGE)
+        query.exec()
+        text = query.value(0) if query.next() else None
+        query.finish()
+        for row in text.split('\x1e') if text else ():
+            rec_id, name, location, contact = row.split('\x1f')
+            for seen, key in zip(first, block_keys(name, location, contact)):
+                if key is not None:
+                    other = seen.setdefault(hash(key), rec_id)
+                    if other != rec_id:
+                        groups.union(int(other), int(rec_id))
+        if progress is not None:
+            progress(min(90, int((start + ID_RANGE - low) * 90 / (high - low + 1))))
+    return [rec_id for ids in groups.groups() for rec_id in ids]
+
+
+# Returns the groups of likely duplicates as (reasons, rows) tuples, rows being
+# (id, name, job, location, contact) tuples ordered by id, oldest first.
+def find_duplicates(conn, progress=None, cancelled=None):
+    ids = candidate_ids(conn, progress, cancelled)
+    rows = {}
+    query = Query(conn)
+    for start in range(0, len(ids), MEMBERS_QUERY):
+        chunk = ids[start:start + MEMBERS_QUERY]
+        query.exec(f"SELECT {contactColumns()} FROM contacts "
+                   f"WHERE id IN ({', '.join(map(str, chunk))})")
+        while query.next():
+            rows[query.value(0)] = (query.value(0), query.value(1), query.value(2), query.value(3), query.value(4))
+    query.finish()
+
+    groups = Groups()
+    reasons = {}
+    first = [{}, {}]
+    for rec_id, row in sorted(rows.items()):
+        for kind, (seen, key) in enumerate(zip(first, block_keys(row[1], row[3], row[4]))):
+            if key is not None:
+                other = seen.setdefault(key, rec_id)
+                if other != rec_id:
+                    groups.union(other, rec_id)
+                    reasons.setdefault(other, set()).add(kind)
+                    reasons.setdefault(rec_id, set()).add(kind)
+
+    result = []
+    for ids in groups.groups():
+        kinds = set().union(*(reasons[rec_id] for rec_id in ids))
+        result.append((', '.join(REASONS[kind] for kind in sorted(kinds)), [rows[rec_id] for rec_id in ids]))
+    result.sort(key=lambda group: group[1][0][0])
+    if progress is not None:
+        progress(100)
+    return result
+
+
+def merge_duplicates(conn, keep, remove):
+    # removes the other records of a group in one transaction and stores the
+    # one kept as MangeDialog would, its number in canonical form when that is free;
+    # nothing is changed when a statement fails
+    conn.transaction()
+    query = Query(conn)
+    query.prepare("DELETE FROM contacts WHERE id = ?")
+    for rec_id in remove:
+        query.addBindValue(rec_id)
+        if not query.exec():
+            conn.rollback()
+            return False
+
+    query.prepare(f"SELECT name, job, location, {contactText()} FROM contacts WHERE id = ?")
+    query.addBindValue(keep)
+    query.exec()
+    row = [query.value(col) for col in range(4)] if query.next() else None
+    query.finish()
+    if row is not None:
+        query.prepare("UPDATE contacts SET name = ?, job = ?, location = ? WHERE id = ?")
+        for value in (name_key(row[0]), name_key(row[1]), name_key(row[2]), keep):
+            query.addBindValue(value)
+        ok = query.exec()
+        if ok and len(contact_key(row[3])) == 10:
+            query.prepare("UPDATE OR IGNORE contacts SET contact = ? WHERE id = ?")
+            query.addBindValue(contact_key(row[3]))
+            query.addBindValue(keep)
+            ok = query.exec()
+        if not ok:
+            conn.rollback()
+            return False
+    return conn.commit()
+
+
+class DedupeWorker(QObject):
+    progress = Signal(int, str)
+    finished = Signal(object)           # groups, see find_duplicates()
+    failed = Signal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.cancelled = False          # set from the GUI thread
+
+    def onProgress(self, percent):
+        self.progress.emit(percent, 'Looking for duplicate contacts...')
+
+    @Slot()
+    def run(self):
+        with connections.connection() as conn:
+            try:
+                if not conn.isOpen():
+                    self.failed.emit(conn.lastError().text())
+                    return
+                groups = find_duplicates(conn, self.onProgress, lambda: self.cancelled)
+                if self.cancelled:
+                    self.failed.emit('Search for duplicates cancelled')
+                else:
+                    self.finished.emit(groups)
+            except Exception as error:
+                self.failed.emit(str(error))
@@ -0,0 +1,141 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from PySide6.QtCore import Qt
+from PySide6.QtSql import QSqlDatabase
+from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QTableWidget,
+                               QTableWidgetItem, QPushButton, QAbstractItemView)
+
+from dedupe import merge_duplicates
+from models import ContactsRowsModel
+from module import custom_font
+
+
+class DuplicatesDialog(QDialog):
+    # reviews the groups found by dedupe.find_duplicates(): the ticked records
+    # of a group are merged into the selected one, or the group is skipped
+    def __init__(self, parent, groups):
+        super().__init__(parent=parent)
+        self.parent = parent
+        self.groups = groups
+        self.merged = 0                 # records removed by merging
+        self.resize(int(self.parent.width() * .7), int(self.parent.height() * .6))
+        self.setWindowModality(Qt.WindowModal)
+        self.setWindowTitle('Duplicate Contacts')
+        self.setStyleSheet("background-color: rgb(150, 200, 145)")
+        self.main_layout = QVBoxLayout()
+        self.setLayout(self.main_layout)
+
+        self.setupUI()
+        self.groupList.setCurrentRow(0)
+
+    def setupUI(self):
+        self.groupList = QListWidget()
+        self.groupList.setFixedWidth(300)
+        self.groupList.setStyleSheet('background-color: rgb(245, 245, 245)')
+        for reason, rows in self.groups:
+            self.groupList.addItem(f'{rows[0][1]} ({len(rows)}): {reason}')
+        self.groupList.currentRowChanged.connect(self.showGroup)
+
+        self.membersTable = QTableWidget(0, len(ContactsRowsModel.headers))
+        self.membersTable.setHorizontalHeaderLabels(ContactsRowsModel.headers)
+        self.membersTable.horizontalHeader().setStretchLastSection(True)
+        self.membersTable.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.membersTable.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.membersTable.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.membersTable.setStyleSheet('background-color: rgb(245, 245, 245)')
+
+        self.hintLabel = QLabel('Select the record to keep and tick the ones to merge into it')
+        self.hintLabel.setAlignment(Qt.AlignCenter)
+        self.hintLabel.setWordWrap(True)
+        custom_font(self.hintLabel, font_size=12, bold=False)
+
+        self.mergeButton = QPushButton('&Merge')
+        self.skipButton = QPushButton('&Skip')
+        self.closeButton = QPushButton('&Close')
+        for button in (self.mergeButton, self.skipButton, self.closeButton):
+            button.setStyleSheet('background-color: rgba(150, 150, 150, 1)')
+        self.mergeButton.clicked.connect(self.onMerge)
+        self.skipButton.clicked.connect(self.onSkip)
+        self.closeButton.clicked.connect(self.accept)
+
+        groups_layout = QHBoxLayout()
+        groups_layout.addWidget(self.groupList)
+        groups_layout.addWidget(self.membersTable)
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(self.mergeButton)
+        buttons_layout.addWidget(self.skipButton)
+        buttons_layout.addWidget(self.closeButton)
+
+        self.main_layout.addLayout(groups_layout)
+        self.main_layout.addWidget(self.hintLabel)
+        self.main_layout.addLayout(buttons_layout)
+
+    def showGroup(self, index):
+        self.membersTable.setRowCount(0)
+        self.mergeButton.setEnabled(index >= 0)
+        self.skipButton.setEnabled(index >= 0)
+        if index < 0:
+            self.hintLabel.setText('No more duplicates to review')
+            return
+
+        rows = self.groups[index][1]
+        self.membersTable.setRowCount(len(rows))
+        for row, contact in enumerate(rows):
+            for col, value in enumerate(contact):
+                item = QTableWidgetItem(str(value))
+                if col == 0:
+                    item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                    item.setCheckState(Qt.Checked)
+                self.membersTable.setItem(row, col, item)
+        # the oldest record is kept unless another one is selected
+        self.membersTable.selectRow(0)
+
+    def removeGroup(self, index):
+        del self.groups[index]
+        self.groupList.blockSignals(True)
+        self.groupList.takeItem(index)
+        self.groupList.blockSignals(False)
+        self.showGroup(self.groupList.currentRow())
+
+    def onMerge(self):
+        index = self.groupList.currentRow()
+        rows = self.groups[index][1]
+        selected = self.membersTable.selectionModel().selectedRows()
+        if not selected:
+            self.hintLabel.setText('Select the record to keep')
+            return
+        keep = rows[selected[0].row()][0]
+        remove = [contact[0] for row, contact in enumerate(rows)
+                  if contact[0] != keep and self.membersTable.item(row, 0).checkState() == Qt.Checked]
+        if not remove:
+            self.hintLabel.setText('Tick the records to merge into the selected one')
+            return
+
+        if not merge_duplicates(QSqlDatabase.database(), keep, remove):
+            self.hintLabel.setText('Could not merge the records!')
+            return
+        self.merged += len(remove)
+        self.hintLabel.setText(f'{len(remove)} record(s) merged into {keep}')
+        self.removeGroup(index)
+
+    def onSkip(self):
+        self.removeGroup(self.groupList.currentRow())
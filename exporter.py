@@ -0,0 +1,143 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import json
+
+from PySide6.QtCore import QObject, Signal, Slot
+
+from connections import connections
+from database import contactColumns, searchCondition
+from querylog import Query
+
+CHUNK_SIZE = 1000           # rows formatted before each write to the file
+FORMATS = ('csv', 'vcf', 'jsonl')
+
+
+def csv_field(value):
+    if any(char in value for char in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def vcard_field(value):
+    return value.replace('\\', '\\\\').replace(',', '\\,').replace(';', '\\;')
+
+
+def format_csv(row):
+    return ','.join(csv_field(str(value)) for value in row[1:]) + '\r\n'
+
+
+def format_vcard(row):
+    _, name, job, location, contact = (vcard_field(str(value)) for value in row)
+    return (f'BEGIN:VCARD\r\nVERSION:3.0\r\nFN:{name}\r\nTITLE:{job}\r\n'
+            f'ADR:;;;{location};;;\r\nTEL;TYPE=CELL:{contact}\r\nEND:VCARD\r\n')
+
+
+def format_jsonl(row):
+    return json.dumps(dict(zip(('id', 'name', 'job', 'location', 'contact'), row))) + '\n'
+
+
+def export_format(path):
+    extension = path.rsplit('.', 1)[-1].lower()
+    if extension == 'vcard':
+        return 'vcf'
+    return extension if extension in FORMATS else 'csv'
+
+
+# Streams the contacts matching the search (all contacts when column is None)
+# from a forward only query to path, CHUNK_SIZE rows at a time, so memory use
+# does not depend on the number of rows. Returns the number of rows written.
+def export_contacts(conn, path, column=None, text='', progress=None, cancelled=None):
+    fmt = export_format(path)
+    formatter = {'csv': format_csv, 'vcf': format_vcard, 'jsonl': format_jsonl}[fmt]
+
+    where, pattern = searchCondition(column, text) if column else ('1', None)
+    query = Query(conn)
+    query.prepare(f"SELECT count(*) FROM contacts WHERE {where}")
+    if pattern is not None:
+        query.bindValue(':pattern', pattern)
+    query.exec()
+    total = query.value(0) if query.next() else 0
+    query.finish()
+
+    query.setForwardOnly(True)
+    query.prepare(f"SELECT {contactColumns()} FROM contacts WHERE {where} "
+                  f"ORDER BY name COLLATE NOCASE, id")
+    if pattern is not None:
+        query.bindValue(':pattern', pattern)
+    if not query.exec():
+        raise RuntimeError(query.lastError().text())
+
+    written = 0
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        if fmt == 'csv':
+            file.write('Name,Job,Location,Contact\r\n')
+        chunk = []
+        while query.next():
+            chunk.append(formatter((query.value(0), query.value(1), query.value(2),
+                                    query.value(3), query.value(4))))
+            if len(chunk) == CHUNK_SIZE:
+                file.write(''.join(chunk))
+                written += len(chunk)
+                chunk.clear()
+                if cancelled is not None and cancelled():
+                    break
+                if progress is not None:
+                    progress(int(written * 100 / (total or 1)), written)
+        else:
+            file.write(''.join(chunk))
+            written += len(chunk)
+    query.finish()
+
+    if progress is not None:
+        progress(100, written)
+    return written
+
+
+class ExportWorker(QObject):
+    progress = Signal(int, str)
+    finished = Signal(int)
+    failed = Signal(str)
+
+    def __init__(self, path, column=None, text=''):
+        super().__init__()
+        self.path = path
+        self.column = column
+        self.text = text
+        self.cancelled = False          # set from the GUI thread
+
+    def onProgress(self, percent, written):
+        self.progress.emit(percent, f'Exported {written} contact(s)')
+
+    @Slot()
+    def run(self):
+        with connections.connection() as conn:
+            try:
+                if not conn.isOpen():
+                    self.failed.emit(conn.lastError().text())
+                    return
+                written = export_contacts(conn, self.path, self.column, self.text,
+                                          self.onProgress, lambda: self.cancelled)
+                if self.cancelled:
+                    self.failed.emit(f'Export cancelled, {self.path} is incomplete')
+                else:
+                    self.finished.emit(written)
+            except Exception as error:
+                self.failed.emit(str(error))
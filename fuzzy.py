@@ -0,0 +1,85 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from math import ceil
+
+from database import MAX_TRIGRAMS, contactColumns, orderBy
+from querylog import Query
+
+# Typo tolerant name search over the name_trigrams index, see database.addTrigramIndex()
+MIN_SIMILARITY = 0.3        # share of trigrams two names must have in common
+MAX_RESULTS = 200
+
+# SQLite's upper() only folds ASCII letters
+UPPER = str.maketrans('abcdefghijklmnopqrstuvwxyz', 'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+
+def trigrams(name):
+    padded = f' {name.translate(UPPER)} '
+    return {padded[n:n + 3] for n in range(min(len(name), MAX_TRIGRAMS))}
+
+
+def fuzzy_search(conn, text, limit=MAX_RESULTS, sort=None, descending=False):
+    # The limit most similar rows, by shared trigrams / trigrams of either name,
+    # ordered by similarity or else by the sort column.
+    # Similarity only depends on the name, and a book has far fewer distinct names
+    # than contacts: every name with enough trigrams in common is scored, and the
+    # contacts are read name by name, the most similar first, until there are limit.
+    grams = sorted(trigrams(text.strip()))
+    if not grams or limit <= 0:
+        return []
+
+    needed = max(1, ceil(MIN_SIMILARITY * len(grams)))
+    names = Query(conn)
+    names.setForwardOnly(True)
+    names.prepare(f"""
+            SELECT name, shared * 1.0 / ({len(grams)} + min(length(name), {MAX_TRIGRAMS}) - shared) AS similarity
+            FROM (SELECT name_id, count(*) AS shared FROM name_trigrams
+                  WHERE trigram IN ({', '.join('?' * len(grams))})
+                  GROUP BY name_id HAVING shared >= {needed})
+            JOIN contact_names ON contact_names.id = name_id
+            WHERE similarity >= {MIN_SIMILARITY}
+            ORDER BY similarity DESC, name COLLATE NOCASE
+        """)
+    for gram in grams:
+        names.addBindValue(gram)
+    names.exec()
+
+    # contact_names holds one spelling of a name, its contacts may have it in any case
+    contacts = Query(conn)
+    contacts.setForwardOnly(True)
+    contacts.prepare(f"SELECT {contactColumns()} FROM contacts WHERE name = ? COLLATE NOCASE ORDER BY id LIMIT ?")
+    rows = []
+    while len(rows) < limit and names.next():
+        contacts.addBindValue(names.value(0))
+        contacts.addBindValue(limit - len(rows))
+        contacts.exec()
+        while contacts.next():
+            rows.append((contacts.value(0), contacts.value(1), contacts.value(2), contacts.value(3), contacts.value(4)))
+        contacts.finish()
+    names.finish()
+
+    if sort and rows:
+        ids = ', '.join(str(row[0]) for row in rows)
+        contacts.exec(f"SELECT {contactColumns()} FROM contacts WHERE id IN ({ids}) ORDER BY {orderBy(sort, descending)}")
+        rows = []
+        while contacts.next():
+            rows.append((contacts.value(0), contacts.value(1), contacts.value(2), contacts.value(3), contacts.value(4)))
+        contacts.finish()
+    return rows
@@ -0,0 +1,205 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import csv
+import io
+import os
+from itertools import islice
+
+from PySide6.QtCore import QObject, Signal, Slot
+
+from connections import connections
+from database import contactText, finishBulkInsert, startBulkInsert
+from querylog import Query
+from validation import CONTACT
+
+BATCH_SIZE = 10000          # rows read between progress reports, a multiple of CHUNK_SIZE
+CHUNK_SIZE = 1000           # rows validated together
+MAX_REJECTS = 20            # rejected rows kept for the report, the rest are only counted
+FIELDS = ('name', 'job', 'location', 'contact')
+
+
+def read_csv(text):
+    # yields (line number, [name, job, location, contact]); a header row may name the columns
+    reader = csv.reader(text)
+    columns = list(range(len(FIELDS)))
+    for row in reader:
+        header = [cell.strip().lower() for cell in row]
+        if reader.line_num == 1 and all(field in header for field in FIELDS):
+            columns = [header.index(field) for field in FIELDS]
+            continue
+        yield reader.line_num, [row[col] if col < len(row) else '' for col in columns]
+
+
+def unfold(text):
+    # vCard lines starting with a space or tab continue the previous line
+    previous = None
+    for line_no, line in enumerate(text, start=1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and previous is not None:
+            previous = (previous[0], previous[1] + line[1:])
+            continue
+        if previous is not None:
+            yield previous
+        previous = (line_no, line)
+    if previous is not None:
+        yield previous
+
+
+def read_vcard(text):
+    # FN -> name, TITLE -> job, locality of ADR -> location, first TEL -> contact
+    card = None
+    start = 0
+    for line_no, line in unfold(text):
+        upper = line.upper()
+        if upper.startswith('BEGIN:VCARD'):
+            card = {}
+            start = line_no
+        elif upper.startswith('END:VCARD') and card is not None:
+            yield start, [card.get('FN', ''), card.get('TITLE', ''), card.get('ADR', ''), card.get('TEL', '')]
+            card = None
+        elif card is not None and ':' in line:
+            key, value = line.split(':', 1)
+            prop = key.split(';')[0].split('.')[-1].upper()
+            if prop == 'ADR':
+                parts = value.split(';')
+                value = parts[3] if len(parts) > 3 else ''
+            value = value.replace('\\,', ',').replace('\\;', ';').replace('\\\\', '\\')
+            card.setdefault(prop, value)
+
+
+def used_contacts(conn, contacts):
+    # those of the 10 digit contact numbers that the book has already, in one lookup
+    if not contacts:
+        return set()
+    query = Query(conn)
+    query.setForwardOnly(True)
+    query.exec(f"SELECT {contactText()} FROM contacts "
+               f"WHERE contact IN ({', '.join(str(int(contact)) for contact in contacts)})")
+    used = set()
+    while query.next():
+        used.add(query.value(0))
+    query.finish()
+    return used
+
+
+# Streams contacts from a CSV or vCard file into the contacts table. Valid rows
+# are inserted with prepared statements inside a single transaction, so a failed
+# or cancelled import leaves the table untouched. QSQLITE only emulates
+# execBatch() and is far slower with it than with one exec() per row. The
+# indexes and the change log are filled once at the end, see startBulkInsert().
+# Returns (imported, rejected, rejects), rejects holding up to MAX_REJECTS
+# (line number, reason) tuples.
+def import_contacts(conn, path, progress=None, cancelled=None):
+    size = os.path.getsize(path) or 1
+    raw = open(path, 'rb')
+    text = io.TextIOWrapper(raw, encoding='utf-8-sig', errors='replace', newline='')
+    reader = read_vcard(text) if path.lower().endswith(('.vcf', '.vcard')) else read_csv(text)
+
+    insert = Query(conn)
+    insert.prepare("INSERT INTO contacts(name, job, location, contact) VALUES (?, ?, ?, ?)")
+
+    read = imported = rejected = 0
+    rejects = []
+
+    def reject(line_no, reason):
+        nonlocal rejected
+        rejected += 1
+        if len(rejects) < MAX_REJECTS:
+            rejects.append((line_no, reason))
+
+    conn.transaction()
+    try:
+        last = startBulkInsert(conn)
+        for chunk in iter(lambda: list(islice(reader, CHUNK_SIZE)), []):
+            if cancelled is not None and cancelled():
+                conn.rollback()
+                return imported, rejected, rejects
+
+            records, errors = CONTACT.validate_batch([fields for _, fields in chunk])
+            reasons = {}
+            for error in errors:
+                reasons.setdefault(error.row, error.message)
+            # rows of the chunk are checked against each other as they are inserted
+            used = used_contacts(conn, [data[3] for data in records if data is not None])
+
+            for row, (line_no, _) in enumerate(chunk):
+                data = records[row]
+                if data is None:
+                    reject(line_no, reasons[row])
+                    continue
+
+                contact = data[3]
+                if contact in used:
+                    reject(line_no, f'Contact number {contact} is already used')
+                    continue
+                used.add(contact)
+
+                for col, value in enumerate(data):
+                    insert.bindValue(col, value)
+                if not insert.exec():
+                    raise RuntimeError(insert.lastError().text())
+                imported += 1
+
+            # rows read rather than imported, a file of rejected rows reports its progress too
+            read += len(chunk)
+            if progress is not None and read % BATCH_SIZE == 0:
+                progress(int(raw.tell() * 100 / size), imported, rejected)
+
+        finishBulkInsert(conn, last)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        text.close()
+
+    if progress is not None:
+        progress(100, imported, rejected)
+    return imported, rejected, rejects
+
+
+class ImportWorker(QObject):
+    progress = Signal(int, str)
+    finished = Signal(int, int, object)         # imported, rejected, rejects
+    failed = Signal(str)
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.cancelled = False          # set from the GUI thread
+
+    def onProgress(self, percent, imported, rejected):
+        self.progress.emit(percent, f'Imported {imported} contact(s), rejected {rejected}')
+
+    @Slot()
+    def run(self):
+        with connections.connection() as conn:
+            try:
+                if not conn.isOpen():
+                    self.failed.emit(conn.lastError().text())
+                    return
+                result = import_contacts(conn, self.path, self.onProgress, lambda: self.cancelled)
+                if self.cancelled:
+                    self.failed.emit('Import cancelled, no contacts were added')
+                else:
+                    self.finished.emit(*result)
+            except Exception as error:
+                self.failed.emit(str(error))
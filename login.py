@@ -18,34 +18,35 @@
 """
 
 import sys
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, Signal
 from PySide6.QtGui import QIcon, QFont
-from PySide6.QtSql import QSqlDatabase
 from PySide6.QtWidgets import (QApplication, QDialog, QVBoxLayout, QHBoxLayout, QFormLayout,
                                QLabel, QLineEdit, QPushButton, QMessageBox)
 
-from database import createTables
-from main_window import MainWindow
-from models import UsersModel
+from connections import ProfileError, connections
+from database import createTables, MigrationError
+from models import users
 from module import custom_font
 
 
 class LogInWindow(QDialog):
+    painted = Signal()
+
     def __init__(self):
         super(LogInWindow, self).__init__()
 
         if not self.createConnection():
             sys.exit(1)
 
-        self.model = UsersModel(self).model
-        if not self.model.rowCount():
-            UsersModel(self).addUser()
+        if users.isEmpty() and not users.addDefaultUsers():
+            QMessageBox.critical(self, 'Error', 'Could not create user!')
 
         self.setWindowIcon(QIcon('icons/app32.png'))
         self.setWindowTitle('MyContacts')
         self.setStyleSheet("background-color: rgb(50, 170, 150)")
         self.setFixedSize(600, 400)
         self.main_window_open = False           # whether MainWindow is called or not
+        self.first_paint = True
         self.initUI()
         self.show()
 
@@ -119,28 +120,27 @@ class LogInWindow(QDialog):
 
         self.setLayout(main_layout)
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.first_paint:
+            self.first_paint = False
+            self.painted.emit()
+
     def onLogin(self):
         username = self.edit_username.text()
         password = self.edit_password.text()
 
-        admin_record = self.model.record(0)
-        admin_username = admin_record.field(1).value()
-        admin_password = admin_record.field(2).value()
-
-        user_record = self.model.record(1)
-        user_username = user_record.field(1).value()
-        user_password = user_record.field(2).value()
-
-        if (username == admin_username and password == admin_password) or (username == user_username and password == user_password):
+        if users.authenticate(username, password):
+            from main_window import MainWindow
             win = MainWindow()
             win.conn = self.conn
+            win.username = username
             win.show()
             self.main_window_open = True
             self.close()
 
-            if username == admin_username and password == admin_password:
-                win.user_no = 0
-                win.actionResetUserPassword.setEnabled(True)
+            win.updateUserActions()
+            win.backupIfDue()
         else:
             self.label_invalid_login.show()
             self.edit_password.setText('')
@@ -158,20 +158,32 @@ class LogInWindow(QDialog):
 
     def closeEvent(self, event):
         if not self.main_window_open:
-            self.conn.close()
-            self.conn.setDatabaseName("")
-            QSqlDatabase.removeDatabase(QSqlDatabase.database().connectionName())
+            connections.close()
 
         event.accept()
 
     def createConnection(self):
-        self.conn = QSqlDatabase.addDatabase("QSQLITE")
-        self.conn.setDatabaseName("contacts.sqlite")
-        if not self.conn.open():
+        try:
+            self.conn = connections.open("contacts.sqlite")
+        except ProfileError as error:
+            QMessageBox.warning(None, "Database Error", str(error))
+            return False
+        if not self.conn.isOpen():
             QMessageBox.warning(None, "Database Error",
                                 f"Unable to connect to the database\n\n{self.conn.lastError().text()}")
             return False
 
-        createTables()
+        try:
+            duplicates = createTables()
+        except MigrationError as error:
+            QMessageBox.warning(None, "Database Error",
+                                f"Unable to upgrade the database\n\n{error}")
+            return False
+
+        if duplicates:
+            numbers = '\n'.join(f'{contact}: {names}' for contact, names in duplicates)
+            QMessageBox.warning(None, "Duplicate Contacts",
+                                f"The following contact numbers are used more than once. "
+                                f"Please remove the duplicates so that they can be indexed.\n\n{numbers}")
         return True
 
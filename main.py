@@ -18,14 +18,21 @@
 """
 
 import sys
+from time import perf_counter
 
-from PySide6.QtWidgets import QApplication
-from login import LogInWindow
+STARTED = perf_counter()        # before Qt is imported, see --startup-time
 
 
 def main():
+    from PySide6.QtWidgets import QApplication
+    from login import LogInWindow
+
     app = QApplication(sys.argv)
     win = LogInWindow()
+    if '--startup-time' in sys.argv:
+        # report the time until the login window is first painted, then quit
+        win.painted.connect(lambda: print(f'startup: {(perf_counter() - STARTED) * 1000:.0f} ms'))
+        win.painted.connect(app.quit)
     app.exec()
     sys.exit()
 
@@ -17,25 +17,48 @@
     along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from PySide6.QtCore import Qt, QDate
+from importlib import import_module
+
+from PySide6.QtCore import Qt, QDate, QThread, QTimer
 from PySide6.QtGui import QIcon, QAction
-from PySide6.QtSql import QSqlDatabase
 from PySide6.QtWidgets import (QMainWindow, QWidget, QHBoxLayout, QVBoxLayout,
                                QTableView, QAbstractItemView, QPushButton, QDialog,
-                               QLineEdit, QMessageBox, QLabel, QComboBox)
-
-from about import About
-from models import ContactsModel, UsersModel
-from contacts import MangeDialog
-from change_password import ChangePassword
+                               QLineEdit, QMessageBox, QLabel, QComboBox, QFileDialog,
+                               QProgressDialog, QProgressBar)
+
+from backup import BackupWorker, backup_dir, backup_due
+from connections import connections
+from models import ADMIN, DEFAULT_USERS, ContactsModel, users
+from database import SORT_COLUMNS, tableExists
+from querylog import site_text, stats
 from module import custom_font, init_win
+from search import SEARCH_MODES, ContactsSearch, SearchResultsModel
+from writer import writer
+
+# imported on first use, not before the main window is shown
+LAZY = {
+    'About': 'about',
+    'BatchEditDialog': 'contacts',
+    'ChangePassword': 'change_password',
+    'DedupeWorker': 'dedupe',
+    'DuplicatesDialog': 'duplicates',
+    'ExportWorker': 'exporter',
+    'ImportWorker': 'importer',
+    'MangeDialog': 'contacts',
+    'QueryStatsDialog': 'query_stats',
+}
+
+
+def lazy(name):
+    return getattr(import_module(LAZY[name]), name)
 
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.conn = None
-        self.user_no = 1
+        self.username = None        # set by the login window
+        self.loggedOut = False      # the account was removed, the window closes without asking
         self.setWindowModality(Qt.ApplicationModal.WindowModal)
         self.wd = .8
         self.ht = .962
@@ -54,7 +77,11 @@ class MainWindow(QMainWindow):
         self.combo_bg = 'background-color: rgba(50, 145, 255, 1)'
 
         self.contactsModel = ContactsModel(self)
-        self.usersModel = UsersModel(self)
+        self.resultsModel = SearchResultsModel(self)
+        self.search = ContactsSearch(self.contactsModel, self)
+        self.search.resultsReady.connect(self.onSearchFinished)
+        self.contactsModel.watch()
+        users.changed.connect(self.onUsersChanged)
 
         self.createMenu()
         self.createToolbar()
@@ -79,15 +106,58 @@ class MainWindow(QMainWindow):
         self.actionAbout.setStatusTip("About the application and developer")
         self.actionAbout.triggered.connect(self.onAbout)
 
+        self.actionImport = QAction(QIcon('icons/import.png'), '&Import Contacts', self)
+        self.actionImport.setShortcut("Ctrl+I")
+        self.actionImport.setStatusTip("Import contacts from a CSV or vCard file")
+        self.actionImport.triggered.connect(self.onImport)
+
+        self.actionExport = QAction(QIcon('icons/export.png'), '&Export Contacts', self)
+        self.actionExport.setShortcut("Ctrl+E")
+        self.actionExport.setStatusTip("Export the listed contacts to a CSV, vCard or JSON Lines file")
+        self.actionExport.triggered.connect(self.onExport)
+
+        self.actionDedupe = QAction('Find &Duplicates', self)
+        self.actionDedupe.setShortcut("Ctrl+D")
+        self.actionDedupe.setStatusTip("Find contacts entered more than once and merge them")
+        self.actionDedupe.triggered.connect(self.onFindDuplicates)
+
+        self.actionBackup = QAction('&Back Up Now', self)
+        self.actionBackup.setShortcut("Ctrl+K")
+        self.actionBackup.setStatusTip("Back up the contacts book while you keep working")
+        self.actionBackup.triggered.connect(self.onBackup)
+
+        self.actionRestore = QAction('R&estore Backup', self)
+        self.actionRestore.setStatusTip("Replace the contacts with those of a backup")
+        self.actionRestore.triggered.connect(self.onRestore)
+        self.actionRestore.setEnabled(False)
+
+        self.actionQueryTime = QAction('Show &Query Time', self)
+        self.actionQueryTime.setCheckable(True)
+        self.actionQueryTime.setStatusTip("Show the time taken by the last database query")
+        self.actionQueryTime.toggled.connect(self.onQueryTimeToggled)
+
+        self.actionQueryStats = QAction('Query &Statistics', self)
+        self.actionQueryStats.setStatusTip("Show the median and slowest times of each database query")
+        self.actionQueryStats.triggered.connect(self.onQueryStats)
+
         # create menus
         self.menuBar().setStyleSheet("background-color: rgb(120, 200, 120)")
+        self.contactsMenu = self.menuBar().addMenu("&Contacts")
         self.adminMenu = self.menuBar().addMenu("A&dmin")
         self.userMenu = self.menuBar().addMenu("U&ser")
 
         # adding action to menus
+        self.contactsMenu.addAction(self.actionImport)
+        self.contactsMenu.addAction(self.actionExport)
+        self.contactsMenu.addAction(self.actionDedupe)
+        self.contactsMenu.addAction(self.actionBackup)
+
         self.adminMenu.addAction(self.actionResetUserPassword)
+        self.adminMenu.addAction(self.actionRestore)
 
         self.userMenu.addAction(self.actionChangePassword)
+        self.userMenu.addAction(self.actionQueryTime)
+        self.userMenu.addAction(self.actionQueryStats)
         self.userMenu.addAction(self.actionAbout)
 
     def createToolbar(self):
@@ -107,18 +177,19 @@ class MainWindow(QMainWindow):
 
         # Create table view widget
         self.table = QTableView()
-        self.table.setModel(self.model)
         self.table.setStyleSheet("background-color: rgb(220, 220, 255)")
         self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.table.horizontalHeader().setStretchLastSection(True)
-        self.table.setSelectionMode(QTableView.SingleSelection)
+        self.table.setSelectionMode(QTableView.ExtendedSelection)
         self.table.setSelectionBehavior(QTableView.SelectRows)
         self.table.setAutoScroll(True)
-        self.table.hideColumn(0)
-
-        self.table.setColumnWidth(1, 300)
-        self.table.setColumnWidth(2, 225)
-        self.table.setColumnWidth(3, 215)
+        # not view sorting, that would load every row; see onSortChanged()
+        header = self.table.horizontalHeader()
+        header.setSectionsClickable(True)
+        header.setSortIndicatorShown(True)
+        header.setSortIndicator(1, Qt.AscendingOrder)
+        header.sortIndicatorChanged.connect(self.onSortChanged)
+        self.showModel(self.model)
 
         # Create other widgets
         self.addButton = QPushButton(QIcon('icons/add.png'), '&Add')
@@ -127,12 +198,12 @@ class MainWindow(QMainWindow):
         self.addButton.clicked.connect(self.onAddContact)
 
         self.updateButton = QPushButton(QIcon('icons/update.png'), "&Update")
-        self.updateButton.setStatusTip("Edit the selected record")
+        self.updateButton.setStatusTip("Edit the selected record(s)")
         self.updateButton.setStyleSheet(self.button_bg)
         self.updateButton.clicked.connect(self.onUpdateContact)
 
         self.removeButton = QPushButton(QIcon('icons/remove.png'), "&Remove")
-        self.removeButton.setStatusTip("Delete the selected record")
+        self.removeButton.setStatusTip("Delete the selected record(s)")
         self.removeButton.setStyleSheet(self.button_bg)
         self.removeButton.clicked.connect(self.onRemoveContact)
 
@@ -149,9 +220,14 @@ class MainWindow(QMainWindow):
         self.searchCombo.setFixedWidth(275)
         custom_font(self.searchCombo, 14)
         self.searchCombo.setStyleSheet(self.combo_bg)
-        self.searchCombo.addItems(['Select',
-                                   'Search by Name', 'Search by Job',
-                                   'Search by Location', 'Search by Contact Number'])
+        self.searchCombo.addItem('Select')
+        for label, column, placeholder in SEARCH_MODES:
+            self.searchCombo.addItem(label, (column, placeholder))
+            if column == 'all' and not tableExists('contacts_fts'):
+                index = self.searchCombo.count() - 1
+                self.searchCombo.model().item(index).setEnabled(False)
+                self.searchCombo.setItemData(index, 'Not available: SQLite was built without full-text search (FTS5)',
+                                             Qt.ToolTipRole)
         self.searchCombo.setCurrentIndex(0)
         self.searchCombo.currentIndexChanged.connect(self.onIndexChanged)
 
@@ -219,25 +295,76 @@ class MainWindow(QMainWindow):
 
         self.searchEdit.setFocus()
 
+    def showModel(self, model):
+        if self.table.model() is model:
+            return
+        self.table.setModel(model)
+        self.table.hideColumn(0)
+
+        self.table.setColumnWidth(1, 300)
+        self.table.setColumnWidth(2, 225)
+        self.table.setColumnWidth(3, 215)
+
     def create_statusbar(self):
         curr_date = QDate.currentDate()
         self.statusLabel = QLabel(curr_date.toString('dd-MMM-yyyy'))
         self.statusLabel.setStyleSheet('border :2px solid blue;')
         self.statusBar().addPermanentWidget(self.statusLabel, 0)
+
+        self.queryLabel = QLabel()
+        self.queryLabel.setVisible(False)
+        self.statusBar().insertPermanentWidget(0, self.queryLabel, 0)
+        self.queryTimer = QTimer(self)
+        self.queryTimer.setInterval(500)
+        self.queryTimer.timeout.connect(self.showQueryTime)
+
+        self.backupProgress = QProgressBar()
+        self.backupProgress.setFormat('Backup %p%')
+        self.backupProgress.setMaximumWidth(200)
+        self.backupProgress.setVisible(False)
+        self.statusBar().insertPermanentWidget(0, self.backupProgress, 0)
+        self.backupThread = None
         self.statusBar().setStyleSheet('border :1px solid black;')
         # self.statusBar().setStyleSheet('background-color: rgb(50, 170, 150); border :1px solid black;')
 
+    def onQueryTimeToggled(self, checked):
+        self.queryLabel.setVisible(checked)
+        if checked:
+            self.showQueryTime()
+            self.queryTimer.start()
+        else:
+            self.queryTimer.stop()
+
+    def showQueryTime(self):
+        if stats.last is not None:
+            sql, elapsed, rows, site = stats.last
+            self.queryLabel.setText(f'Last query: {elapsed:.1f} ms, {rows} row(s)')
+            self.queryLabel.setToolTip(f'{site_text(site)}\n{sql}')
+
+    def onQueryStats(self):
+        lazy('QueryStatsDialog')(self).exec()
+
     def keyPressEvent(self, event):
         if event.key == Qt.Key_Escape:
             self.close()
 
     def closeEvent(self, event):
-        confirm = QMessageBox.question(self, "Confirm Exit ", f"Are you sure you want to exit?")
+        if self.loggedOut:
+            confirm = QMessageBox.Yes
+        else:
+            confirm = QMessageBox.question(self, "Confirm Exit ", f"Are you sure you want to exit?")
         if confirm == QMessageBox.Yes:
 
-            self.conn.close()
-            self.conn.setDatabaseName("")
-            QSqlDatabase.removeDatabase(QSqlDatabase.database().connectionName())
+            self.contactsModel.timer.stop()
+            if self.backupThread is not None:
+                # the unfinished backup is thrown away
+                self.backupWorker.finished.disconnect()
+                self.backupWorker.failed.disconnect()
+                self.backupWorker.cancelled = True
+                self.endBackup()
+            self.search.close()
+            writer.close()
+            connections.close()
 
             event.accept()
         else:
@@ -248,49 +375,77 @@ class MainWindow(QMainWindow):
         self.searchEdit.setText('')
         if self.searchCombo.currentIndex() == 0:
             self.searchEdit.setVisible(False)
-            self.model.setFilter('')
         else:
             self.searchEdit.setVisible(True)
             self.searchEdit.setFocus()
-            if self.searchCombo.currentIndex() == 1:
-                self.searchEdit.setPlaceholderText('Enter Name')
-            elif self.searchCombo.currentIndex() == 2:
-                self.searchEdit.setPlaceholderText('Enter Job')
-            elif self.searchCombo.currentIndex() == 3:
-                self.searchEdit.setPlaceholderText('Enter Location')
-            elif self.searchCombo.currentIndex() == 4:
-                self.searchEdit.setPlaceholderText('Enter Contact Number')
+            self.searchEdit.setPlaceholderText(self.searchCombo.currentData()[1])
+
+    def searchColumn(self):
+        mode = self.searchCombo.currentData()
+        return mode[0] if mode else None
 
     def onTextChanged(self, text):
-        if self.searchCombo.currentIndex() == 1:
-            self.model.setFilter("name like '" + text + "%'")
-        elif self.searchCombo.currentIndex() == 2:
-            self.model.setFilter("job like '" + text + "%'")
-        elif self.searchCombo.currentIndex() == 3:
-            self.model.setFilter("location like '" + text + "%'")
-        elif self.searchCombo.currentIndex() == 4:
-            self.model.setFilter("contact like '" + text + "%'")
+        # the query runs on the search thread, see search.ContactsSearch
+        column = self.searchColumn()
+        if column and text:
+            self.search.search(column, text)
         else:
-            self.model.setFilter('')
+            self.search.cancel()
+            self.showModel(self.model)
+            self.statusBar().clearMessage()
+
+    def onSortChanged(self, section, order):
+        # both the contacts and the search results are sorted by SQL
+        self.contactsModel.model.sort(section, order)
+        self.search.sortBy(SORT_COLUMNS[section], order == Qt.DescendingOrder)
+        self.onTextChanged(self.searchEdit.text())
+
+    def onContactsChanged(self):
+        # by this or another instance; search results shown are read again
+        if self.table.model() is self.resultsModel:
+            self.onTextChanged(self.searchEdit.text())
+
+    def onSearchFinished(self, rows, elapsed):
+        self.resultsModel.setRows(rows)
+        self.showModel(self.resultsModel)
+        self.statusBar().showMessage(f'{len(rows)} contact(s) found in {elapsed:.0f} ms')
 
     def onAddContact(self):
         self.messageLabel.setVisible(False)
 
         self.table.clearSelection()
-        dialog = MangeDialog(self)
+        dialog = lazy('MangeDialog')(self)
         if dialog.exec() == QDialog.Accepted:
             self.contactsModel.addContact(dialog.data)
             self.searchCombo.setCurrentIndex(0)
             self.messageLabel.setVisible(True)
 
+    def selectedCount(self):
+        return sum(selected.height() for selected in self.table.selectionModel().selection())
+
+    def selectedIds(self):
+        # a query per selected range of rows, not a record per row
+        model = self.table.model()
+        ids = [rec_id for selected in self.table.selectionModel().selection()
+               for rec_id in model.ids(selected.top(), selected.bottom())]
+        return list(dict.fromkeys(ids))
+
     def onUpdateContact(self):
         self.messageLabel.setVisible(False)
-        if self.table.selectedIndexes():
-            row = self.table.currentIndex().row()
-            record = self.model.record(row)
-            dialog = MangeDialog(self, record)
+        count = self.selectedCount()
+        if count > 1:
+            ids = self.selectedIds()
+            dialog = lazy('BatchEditDialog')(self, len(ids))
+            if dialog.exec() == QDialog.Accepted:
+                self.contactsModel.updateContacts(ids, *dialog.data)
+                self.searchCombo.setCurrentIndex(0)
+                self.messageLabel.setVisible(True)
+        elif count:
+            row = self.table.selectionModel().selection()[0].top()
+            record = self.table.model().record(row)
+            dialog = lazy('MangeDialog')(self, record)
             if dialog.exec() == QDialog.Accepted:
-                self.contactsModel.updateContact(row, dialog.data)
+                self.contactsModel.updateContact(record.value(0), dialog.data)
                 self.searchCombo.setCurrentIndex(0)
                 self.messageLabel.setVisible(True)
         else:
@@ -301,14 +456,23 @@ class MainWindow(QMainWindow):
 
     def onRemoveContact(self):
         self.messageLabel.setVisible(False)
-        if self.table.selectedIndexes():
-            row = self.table.currentIndex().row()
-            reord = self.model.record(row)
+        count = self.selectedCount()
+        if count > 1:
+            ids = self.selectedIds()
+            message = f"Do you want to remove {len(ids)} contacts from your Contact Book?"
+            answer = QMessageBox.warning(self, "Remove Contacts", message, QMessageBox.Yes | QMessageBox.No)
+            if answer == QMessageBox.Yes:
+                self.contactsModel.removeContacts(ids)
+                self.searchCombo.setCurrentIndex(0)
+                self.messageLabel.setVisible(True)
+        elif count:
+            row = self.table.selectionModel().selection()[0].top()
+            reord = self.table.model().record(row)
             name = reord.value(1)
             message = f"Do you want to remove '{name}' from your Contact Book?"
             answer = QMessageBox.warning(self, "Remove Contact", message, QMessageBox.Yes | QMessageBox.No)
             if answer == QMessageBox.Yes:
-                self.contactsModel.removeContact(row)
+                self.contactsModel.removeContact(reord.value(0))
                 self.searchCombo.setCurrentIndex(0)
                 self.messageLabel.setVisible(True)
         else:
@@ -319,14 +483,214 @@ class MainWindow(QMainWindow):
 
     def onChangePassword(self):
         self.searchCombo.setCurrentIndex(0)
-        dlg = ChangePassword(self.user_no, self)
+        dlg = lazy('ChangePassword')(self.username, self)
         dlg.show()
 
     def onAbout(self):
         self.searchCombo.setCurrentIndex(0)
-        dlg = About(self)
+        dlg = lazy('About')(self)
         dlg.show()
 
     def onResetUserPassword(self):
         self.searchCombo.setCurrentIndex(0)
-        self.usersModel.resetUserPassword()
+        username, password = DEFAULT_USERS[1]      # the user's password goes back to the default
+        users.changePassword(username, password, self.onUserPasswordReset)
+
+    def updateUserActions(self):
+        # the admin resets the password of the user's account, while there is one
+        admin = self.username == ADMIN
+        self.actionResetUserPassword.setEnabled(admin and users.find(DEFAULT_USERS[1][0]) is not None)
+        self.actionRestore.setEnabled(admin)
+
+    def onUsersChanged(self, username):
+        if self.username is None or username not in ('', self.username, DEFAULT_USERS[1][0]):
+            return
+        if users.find(self.username) is None:
+            QMessageBox.warning(self, 'MyContacts', f'The account {self.username} no longer exists.')
+            self.loggedOut = True
+            self.close()
+            return
+        self.updateUserActions()
+
+    def onUserPasswordReset(self, done):
+        title = 'Reset User Credentials'
+        if done:
+            QMessageBox.information(self, title, f'Password of the user have been reset to {DEFAULT_USERS[1][1]}')
+        else:
+            QMessageBox.critical(self, title, 'Error!!! Could not reset username and Password')
+
+    def startTask(self, worker, title, label):
+        # runs worker.run() on a thread of its own behind a cancellable progress dialog
+        self.taskProgress = QProgressDialog(label, '&Cancel', 0, 100, self)
+        self.taskProgress.setWindowTitle(title)
+        self.taskProgress.setWindowModality(Qt.WindowModal)
+        self.taskProgress.setMinimumDuration(0)
+
+        self.taskThread = QThread(self)
+        self.taskWorker = worker
+        worker.moveToThread(self.taskThread)
+        self.taskThread.started.connect(worker.run)
+        worker.progress.connect(self.onTaskProgress)
+        self.taskProgress.canceled.connect(self.onTaskCanceled)
+        self.taskThread.start()
+
+    def onTaskProgress(self, percent, text):
+        self.taskProgress.setLabelText(text)
+        self.taskProgress.setValue(percent)
+
+    def onTaskCanceled(self):
+        self.taskWorker.cancelled = True
+
+    def endTask(self):
+        self.taskThread.quit()
+        self.taskThread.wait()
+        self.taskProgress.reset()
+        self.taskWorker.deleteLater()
+        self.taskThread.deleteLater()
+
+    def onImport(self):
+        self.searchCombo.setCurrentIndex(0)
+        path, _ = QFileDialog.getOpenFileName(self, 'Import Contacts', '',
+                                              'Contacts (*.csv *.vcf *.vcard);;All files (*)')
+        if not path:
+            return
+
+        worker = lazy('ImportWorker')(path)
+        worker.finished.connect(self.onImportFinished)
+        worker.failed.connect(self.onImportFailed)
+        self.startTask(worker, 'Import Contacts', 'Importing contacts...')
+
+    def onImportFinished(self, imported, rejected, rejects):
+        self.endTask()
+        self.contactsModel.written()
+        self.contactsModel.model.select()
+        message = f'{imported} contact(s) imported, {rejected} rejected'
+        if rejects:
+            lines = '\n'.join(f'Line {line_no}: {reason}' for line_no, reason in rejects)
+            message = f'{message}\n\n{lines}'
+            if rejected > len(rejects):
+                message = f'{message}\n...'
+        QMessageBox.information(self, 'Import Contacts', message)
+
+    def onImportFailed(self, error):
+        self.endTask()
+        QMessageBox.warning(self, 'Import Contacts', error)
+
+    def onExport(self):
+        # exports what the search currently shows
+        column = self.searchColumn()
+        text = self.searchEdit.text()
+        if not text:
+            column = None
+        elif column == 'fuzzy':
+            QMessageBox.information(self, 'Export Contacts',
+                                    'Similar name results cannot be exported, search by name instead')
+            return
+        path, _ = QFileDialog.getSaveFileName(self, 'Export Contacts', 'contacts.csv',
+                                              'CSV (*.csv);;vCard (*.vcf);;JSON Lines (*.jsonl)')
+        if not path:
+            return
+
+        worker = lazy('ExportWorker')(path, column, text)
+        worker.finished.connect(self.onExportFinished)
+        worker.failed.connect(self.onExportFailed)
+        self.startTask(worker, 'Export Contacts', 'Exporting contacts...')
+
+    def onExportFinished(self, written):
+        self.endTask()
+        QMessageBox.information(self, 'Export Contacts', f'{written} contact(s) exported')
+
+    def onExportFailed(self, error):
+        self.endTask()
+        QMessageBox.warning(self, 'Export Contacts', error)
+
+    def onFindDuplicates(self):
+        worker = lazy('DedupeWorker')()
+        worker.finished.connect(self.onDedupeFinished)
+        worker.failed.connect(self.onDedupeFailed)
+        self.startTask(worker, 'Find Duplicates', 'Looking for duplicate contacts...')
+
+    def onDedupeFinished(self, groups):
+        self.endTask()
+        if not groups:
+            QMessageBox.information(self, 'Find Duplicates', 'No duplicate contacts found')
+            return
+
+        dialog = lazy('DuplicatesDialog')(self, groups)
+        dialog.exec()
+        if dialog.merged:
+            self.contactsModel.written()
+            self.contactsModel.model.select()
+            self.messageLabel.setText(f'{dialog.merged} duplicate contact(s) merged')
+
+    def onDedupeFailed(self, error):
+        self.endTask()
+        QMessageBox.warning(self, 'Find Duplicates', error)
+
+    def backupIfDue(self):
+        if backup_due(connections.path):
+            self.onBackup()
+
+    def onBackup(self):
+        # in the background, on a thread of its own, with its progress in the status bar
+        if self.backupThread is not None:
+            return
+        self.actionBackup.setEnabled(False)
+        self.backupProgress.setValue(0)
+        self.backupProgress.setVisible(True)
+
+        self.backupThread = QThread(self)
+        self.backupWorker = BackupWorker(connections.path)
+        self.backupWorker.moveToThread(self.backupThread)
+        self.backupThread.started.connect(self.backupWorker.run)
+        self.backupWorker.progress.connect(lambda percent, text: self.backupProgress.setValue(percent))
+        self.backupWorker.finished.connect(self.onBackupFinished)
+        self.backupWorker.failed.connect(self.onBackupFailed)
+        self.backupThread.start()
+
+    def endBackup(self):
+        self.backupThread.quit()
+        self.backupThread.wait()
+        self.backupWorker.deleteLater()
+        self.backupThread.deleteLater()
+        self.backupThread = None
+        self.backupProgress.setVisible(False)
+        self.actionBackup.setEnabled(True)
+
+    def onBackupFinished(self, path):
+        self.endBackup()
+        self.statusBar().showMessage(f'Contacts backed up to {path}', 10000)
+
+    def onBackupFailed(self, error):
+        self.endBackup()
+        QMessageBox.warning(self, 'Back Up', f'The contacts could not be backed up\n\n{error}')
+
+    def onRestore(self):
+        if self.backupThread is not None:
+            QMessageBox.information(self, 'Restore Backup', 'Please wait for the backup to finish')
+            return
+        path, _ = QFileDialog.getOpenFileName(self, 'Restore Backup', backup_dir(connections.path),
+                                              'Backups (*.sqlite)')
+        if not path:
+            return
+        message = "All contacts and users will be replaced by those of the backup. Do you want to continue?"
+        answer = QMessageBox.warning(self, 'Restore Backup', message, QMessageBox.Yes | QMessageBox.No)
+        if answer != QMessageBox.Yes:
+            return
+
+        self.searchCombo.setCurrentIndex(0)
+        worker = BackupWorker(connections.path, restore=path)
+        worker.finished.connect(self.onRestoreFinished)
+        worker.failed.connect(self.onRestoreFailed)
+        self.startTask(worker, 'Restore Backup', 'Restoring the contacts...')
+
+    def onRestoreFinished(self, path):
+        self.endTask()
+        users.clear()
+        self.contactsModel.written()
+        self.contactsModel.model.select()
+        QMessageBox.information(self, 'Restore Backup', f'Contacts restored from {path}')
+
+    def onRestoreFailed(self, error):
+        self.endTask()
+        QMessageBox.warning(self, 'Restore Backup', error)
@@ -17,115 +17,507 @@
     along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-import sqlite3
-from PySide6.QtCore import Qt
-from PySide6.QtSql import QSqlTableModel
-from PySide6.QtWidgets import QMessageBox
+from collections import OrderedDict
+
+from PySide6.QtCore import Qt, QObject, QTimer, QModelIndex, QAbstractTableModel, Signal
+from PySide6.QtSql import QSqlDatabase, QSqlQuery, QSqlRecord
+
+from connections import BUSY_TIMEOUT_MS
+from database import SORT_COLUMNS, contactColumns, contactText, orderBy, keysetCondition
+from querylog import Query
+from writer import writer
+
+PAGE_SIZE = 200             # rows fetched by one keyset query
+MAX_PAGES = 8               # pages kept in memory, least recently used are evicted
+RELOAD_AFTER = PAGE_SIZE    # more changes than that are read again rather than patched in
+POLL_MS = 1000              # how often the book is checked for changes by other instances
+MAX_POLL_MS = 30000         # the check backs off up to this while the book stays locked
+REFRESH_BUSY_MS = 200       # how long reading the change log waits for a lock before trying later
+ADMIN = 'admin'             # the account allowed to reset the user's password
+DEFAULT_USERS = [(ADMIN, 'manish_1975'), ('user', '1234')]
+NOCASE = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def sort_key(row, column):
+    # same order as database.orderBy() on the column, ascending
+    if column == 0:
+        return (row[0],)
+    value = row[column]
+    if SORT_COLUMNS[column] in ('name', 'job', 'location'):
+        value = value.translate(NOCASE)
+    return value, row[0]
+
+
+class ContactsRowsModel(QAbstractTableModel):
+    # read only table of (id, name, job, location, contact) tuples, subclasses
+    # give the tuple of a row with row(row)
+    headers = ("ID", "Name", "Job", "Location", "Contact No.")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.template = QSqlDatabase.database().record("contacts")
+
+    def columnCount(self, parent=None):
+        return len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self.row(index.row())[index.column()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return super().headerData(section, orientation, role)
+
+    def record(self, row):
+        record = QSqlRecord(self.template)
+        for col, value in enumerate(self.row(row)):
+            record.setValue(col, value)
+        return record
+
+    def ids(self, first, last):
+        # ids of the rows first to last
+        return [self.row(row)[0] for row in range(first, last + 1)]
+
+
+class ContactsTableModel(ContactsRowsModel):
+    # Virtual model over the contacts table sorted on any column, by name
+    # unless the view asks otherwise. Only MAX_PAGES pages are kept in memory;
+    # a page is read with keyset pagination on (sort column, id) after the last
+    # key of the nearest page kept, or from the end of the table when
+    # that is closer. Changes made since, by any connection, are patched in from
+    # the change log, see database.addChangeLog().
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.count = 0
+        self.sortColumn = 1
+        self.descending = False
+        self.pages = OrderedDict()      # page number -> list of rows
+        self.bounds = {}                # page number -> its last row, for the pages kept
+        self.seq = 0                    # last entry of contact_changes the rows include
+
+    def select(self):
+        self.beginResetModel()
+        # one statement, so that the count and the log position are of the same commit; a
+        # count(*) of its own can use the b-tree's row counts instead of scanning
+        query = Query("SELECT (SELECT count(*) FROM contacts), "
+                      "(SELECT seq FROM sqlite_sequence WHERE name = 'contact_changes')")
+        if query.next():
+            self.count, self.seq = query.value(0), query.value(1) or 0
+        else:
+            self.count, self.seq = 0, 0
+        query.finish()
+        self.pages.clear()
+        self.bounds.clear()
+        self.endResetModel()
+        return True
+
+    def rowCount(self, parent=None):
+        return self.count
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # one indexed query for the first page shown, nothing is sorted in memory
+        self.sortColumn = column
+        self.descending = order == Qt.DescendingOrder
+        self.select()
+
+    def key(self, row):
+        return sort_key(row, self.sortColumn)
+
+    def precedes(self, key, other):
+        return key > other if self.descending else key < other
+
+    def row(self, row):
+        page, offset = divmod(row, PAGE_SIZE)
+        rows = self.pages.get(page)
+        if rows is None:
+            rows = self.fetchPage(page)
+            QTimer.singleShot(0, lambda: self.prefetch(page))
+        else:
+            self.pages.move_to_end(page)
+        return rows[offset]
+
+    def prefetch(self, page):
+        for neighbour in (page + 1, page - 1):
+            if 0 <= neighbour * PAGE_SIZE < self.count and neighbour not in self.pages:
+                self.fetchPage(neighbour)
+
+    def fetchPage(self, page):
+        # The page is read from the nearest row whose key is known: the first or
+        # the last of the table, or the last row of a page read before, on either
+        # side. The rows between it and the page are skipped by the index walk of
+        # OFFSET, so the cost grows with the distance to that row; it is the
+        # whole of a jump into the middle of a large table never shown before.
+        start = page * PAGE_SIZE
+        limit = min(PAGE_SIZE, self.count - start)
+        # (rows to skip, bound page or None for an end of the table, reading backwards)
+        starts = [(start, None, False), (self.count - start - limit, None, True)]
+        before = max((p for p in self.bounds if p < page), default=None)
+        if before is not None:
+            starts.append((start - (before + 1) * PAGE_SIZE, before, False))
+        after = min((p for p in self.bounds if p > page), default=None)
+        if after is not None:
+            starts.append(((after + 1) * PAGE_SIZE - 1 - start - limit, after, True))
+        skip, known, backwards = min(starts, key=lambda choice: choice[0])
+
+        column = SORT_COLUMNS[self.sortColumn]
+        descending = self.descending != backwards
+        query = Query()
+        query.setForwardOnly(True)
+        if known is None:
+            query.prepare(f"SELECT {contactColumns()} FROM contacts "
+                          f"ORDER BY {orderBy(column, descending)} LIMIT :limit OFFSET :skip")
+        else:
+            query.prepare(f"SELECT {contactColumns()} FROM contacts "
+                          f"WHERE {keysetCondition(column, descending)} "
+                          f"ORDER BY {orderBy(column, descending)} LIMIT :limit OFFSET :skip")
+            if column != 'id':
+                query.bindValue(':value', self.bounds[known][self.sortColumn])
+            query.bindValue(':id', self.bounds[known][0])
+        query.bindValue(':skip', skip)
+        query.bindValue(':limit', limit)
+        query.exec()
+
+        rows = []
+        while query.next():
+            rows.append((query.value(0), query.value(1), query.value(2), query.value(3), query.value(4)))
+        query.finish()
+        if backwards:
+            rows.reverse()
+
+        # rows may be short if the table changed behind our back
+        rows.extend([(None, '', '', '', '')] * (limit - len(rows)))
+        if rows and rows[-1][0] is not None:
+            self.bounds[page] = rows[-1]
+
+        self.pages[page] = rows
+        while len(self.pages) > MAX_PAGES:
+            evicted, _ = self.pages.popitem(last=False)
+            self.bounds.pop(evicted, None)
+        return rows
+
+    def ids(self, first, last):
+        # one query from the key of the row before, the rows of the range are not paged in
+        column = SORT_COLUMNS[self.sortColumn]
+        bound = self.row(first - 1) if first > 0 else None
+        query = Query()
+        query.setForwardOnly(True)
+        if bound is None or bound[0] is None:
+            query.prepare(f"SELECT id FROM contacts ORDER BY {orderBy(column, self.descending)} "
+                          "LIMIT :limit OFFSET :skip")
+            query.bindValue(':skip', first)
+        else:
+            query.prepare(f"SELECT id FROM contacts WHERE {keysetCondition(column, self.descending)} "
+                          f"ORDER BY {orderBy(column, self.descending)} LIMIT :limit")
+            if column != 'id':
+                query.bindValue(':value', bound[self.sortColumn])
+            query.bindValue(':id', bound[0])
+        query.bindValue(':limit', last - first + 1)
+        query.exec()
+
+        ids = []
+        while query.next():
+            ids.append(query.value(0))
+        query.finish()
+        return ids
+
+    def locate(self, contact):
+        # Row at which the contact sorts. It is exact when the row falls in a
+        # cached page; otherwise it is only known to lie after the nearest page
+        # before it, which is all that reading pages relative to that key needs.
+        key = self.key(contact)
+        after = [page for page, bound in self.bounds.items() if not self.precedes(self.key(bound), key)]
+        if not after:
+            return self.count
+        page = min(after)
+        rows = self.pages.get(page)
+        if rows is None:
+            return page * PAGE_SIZE
+        before = [row for row in rows if row[0] is not None and self.precedes(self.key(row), key)]
+        return page * PAGE_SIZE + len(before)
+
+    def invalidate(self, row):
+        # forget pages from row onwards, they are read again when shown
+        first = row // PAGE_SIZE
+        for page in [page for page in self.pages if page >= first]:
+            del self.pages[page]
+        for page in [page for page in self.bounds if page >= first]:
+            del self.bounds[page]
+
+    def contactInserted(self, contact):
+        row = self.locate(contact)
+        self.invalidate(row)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.count += 1
+        self.endInsertRows()
+        return row
+
+    def contactRemoved(self, contact):
+        row = min(self.locate(contact), self.count - 1)
+        self.invalidate(row)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.count -= 1
+        self.endRemoveRows()
+        return row
+
+    def contactUpdated(self, old, new):
+        row = self.locate(old)
+        page, offset = divmod(row, PAGE_SIZE)
+        rows = self.pages.get(page)
+        if self.key(old) == self.key(new) and rows is not None and offset < len(rows) and rows[offset][0] == old[0]:
+            rows[offset] = tuple(new)
+            self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+            return row
+        self.contactRemoved(old)
+        return self.contactInserted(new)
+
+    def readChanges(self):
+        # ({contact id: (row before, row now)}, last entry) for the entries after
+        # self.seq, a row is None where the contact did not exist; the last entry is
+        # None when the entries are too many, or not the ones that follow self.seq
+        # because the book was restored or some were trimmed, and the whole is None
+        # when the log could not be read
+        query = Query()
+        query.setForwardOnly(True)
+        if not query.exec("SELECT seq FROM sqlite_sequence WHERE name = 'contact_changes'"):
+            return None
+        last = query.value(0) if query.next() else 0
+        query.finish()
+        if last == self.seq:
+            return {}, last
+        if not 0 < last - self.seq <= RELOAD_AFTER:
+            return {}, None
+
+        query.prepare(f"SELECT seq, contact_id, name IS NOT NULL, name, job, location, {contactText()} "
+                      "FROM contact_changes WHERE seq > ? ORDER BY seq")
+        query.addBindValue(self.seq)
+        if not query.exec():
+            return None
+        seq = self.seq
+        before = {}
+        while query.next():
+            if query.value(0) != seq + 1:
+                break
+            seq = query.value(0)
+            contact_id = query.value(1)
+            if contact_id not in before:
+                # the first entry of a contact has it as the rows still show it
+                before[contact_id] = (contact_id, query.value(3), query.value(4), query.value(5),
+                                      query.value(6)) if query.value(2) else None
+        query.finish()
+        if seq != last:
+            return {}, None
+
+        now = dict.fromkeys(before)
+        query.prepare(f"SELECT {contactColumns()} FROM contacts WHERE id IN ({', '.join('?' * len(before))})")
+        for contact_id in before:
+            query.addBindValue(contact_id)
+        if not query.exec():
+            return None
+        while query.next():
+            now[query.value(0)] = (query.value(0), query.value(1), query.value(2), query.value(3), query.value(4))
+        query.finish()
+        return {contact_id: (before[contact_id], now[contact_id]) for contact_id in before}, seq
+
+    def applyChanges(self):
+        # whether contacts changed since the rows were read, None if the log could not be read
+        conn = QSqlDatabase.database()
+        # the log and the contacts are read in one transaction, as of the same commit
+        if not conn.transaction():
+            return None
+        changes = self.readChanges()
+        conn.commit()
+        if changes is None:
+            return None
+
+        changes, seq = changes
+        if seq is None:
+            self.select()
+            return True
+        self.seq = seq
+        for old, new in changes.values():
+            if old is None and new is not None:
+                self.contactInserted(new)
+            elif new is None and old is not None:
+                self.contactRemoved(old)
+            elif old is not None:
+                self.contactUpdated(old, new)
+        return bool(changes)
 
 
 class ContactsModel:
     def __init__(self, parent):
-        self.model = QSqlTableModel()
-        self.model.setTable("contacts")
-        self.model.setEditStrategy(QSqlTableModel.OnManualSubmit)
-        self.model.setSort(1, Qt.AscendingOrder)
+        self.model = ContactsTableModel()
         self.model.select()
         self.parent = parent
-        headers = ("ID", "Name", "Job", "Location", "Contact No.")
-        for columnIndex, header in enumerate(headers):
-            self.model.setHeaderData(columnIndex, Qt.Horizontal, header)
+        self.generation = 0     # bumped by every write, search results cached before it are stale
+        self.version = None
+        self.message = None     # reported once the model shows the write, see onContactsWritten()
+        self.timer = QTimer(parent)
+        self.timer.setInterval(POLL_MS)
+        self.timer.timeout.connect(self.poll)
+
+    def written(self):
+        self.generation += 1
+
+    def watch(self):
+        # Other instances sharing the book are noticed by polling PRAGMA
+        # data_version, which moves whenever another connection commits, the
+        # writer thread's included. The check costs no I/O; the change log is
+        # only read when it moved.
+        self.version = self.dataVersion()
+        self.timer.start()
+
+    def pragma(self, sql):
+        # not through Query, the status bar would show nothing but the polls
+        query = QSqlQuery(QSqlDatabase.database())
+        value = query.value(0) if query.exec(f'PRAGMA {sql}') and query.next() else None
+        query.finish()
+        return value
 
+    def dataVersion(self):
+        return self.pragma('data_version')
+
+    def poll(self):
+        version = self.dataVersion()
+        if version is not None and version == self.version:
+            return
+        if version is not None and self.refresh():
+            self.version = version
+
+    def refresh(self):
+        # patches the model with the changes committed since it was read, by any
+        # connection; while another one holds the book locked the window does not
+        # wait the whole busy timeout, the timer backs off and tries again
+        self.pragma(f'busy_timeout = {REFRESH_BUSY_MS}')
+        changed = self.model.applyChanges()
+        self.pragma(f'busy_timeout = {BUSY_TIMEOUT_MS}')
+        if changed is None:
+            self.timer.setInterval(min(self.timer.interval() * 2, MAX_POLL_MS))
+            return False
+        self.timer.setInterval(POLL_MS)
+        if changed:
+            self.written()
+            self.parent.onContactsChanged()
+        if self.message is not None:
+            self.parent.messageLabel.setText(self.message)
+            self.message = None
+        return True
+
+    # writes go through the writer thread, the model and the message follow once committed
     def addContact(self, data):
-        try:
-            row = self.model.rowCount()
-            self.model.insertRows(row, 1)
-            for col, value in enumerate(data):
-                self.model.setData(self.model.index(row, col + 1), value)
-            self.model.submitAll()
-            self.parent.messageLabel.setText('Record added successfully')
-            self.model.select()
-        except sqlite3.Error:
-            self.parent.messageLabel.setText('Could not add record!')
-
-    def updateContact(self, row, data):
-        try:
-            record = self.model.record(row)
-            for col, value in enumerate(data):
-                record.setValue(col + 1, value)
-            self.model.updateRowInTable(row, record)
-            self.model.submitAll()
-            self.parent.messageLabel.setText('Record updated successfully')
-            self.model.select()
-        except sqlite3.Error:
-            self.parent.messageLabel.setText('Could not update the record! Please try again')
-
-    def removeContact(self, row):
-        try:
-            self.model.removeRow(row)
-            self.model.submitAll()
-            self.model.select()
-            self.parent.messageLabel.setText('Record removed successfully')
-        except Exception:
-            self.parent.messageLabel.setText('Could not remove the record!')
-
-
-class UsersModel:
-    def __init__(self, parent):
-        self.model = QSqlTableModel()
-        self.model.setTable("users")
-        self.model.setEditStrategy(QSqlTableModel.OnManualSubmit)
-        self.model.setSort(1, Qt.AscendingOrder)
-        self.model.select()
-        self.parent = parent
-        headers = ("ID", "Username", "Password")
-        for columnIndex, header in enumerate(headers):
-            self.model.setHeaderData(columnIndex, Qt.Horizontal, header)
-
-    def addUser(self):
-        data = [('admin', 'manish_1975'), ('user', '1234')]
-        for i in range(2):
-            try:
-                row = self.model.rowCount()
-                self.model.insertRows(row, 1)
-                for col, value in enumerate(data[i]):
-                    self.model.setData(self.model.index(row, col + 1), value)
-                self.model.submitAll()
-                self.model.select()
-            except sqlite3.Error:
-                QMessageBox.critical(self.parent, 'Error', 'Could not create user!')
-
-    def resetUserPassword(self):
-        title = 'Reset User Credentials'
-        password = 1234  # default password for user
-        try:
-            record = self.model.record(1)
-            record.setValue(2, password)
-            self.model.updateRowInTable(1, record)
-            self.model.submitAll()
-            self.model.select()
-            msg = f'Password of the user have been reset to {password}'
-            QMessageBox.information(self.parent, title, msg)
-        except sqlite3.Error:
-            QMessageBox.critical(self.parent, title, 'Error!!! Could not reset username and Password')
-
-    def changePassword(self, rec_no, password):
-        title = 'Change Password'
-        try:
-            record = self.model.record(rec_no)
-            record.setValue(2, password)
-            self.model.updateRowInTable(rec_no, record)
-            self.model.submitAll()
-            self.model.select()
-            msg = 'Password has been changed successfully'
-            QMessageBox.information(self.parent, title, msg)
-        except sqlite3.Error:
-            QMessageBox.critical(self.parent, title, 'Error!!! Could not Change Password')
-
-    def removeUser(self, row):
-        try:
-            self.model.removeRow(row)
-            self.model.submitAll()
-            self.model.select()
-            QMessageBox.information(self.parent, 'Remove User', 'User removed successfully')
-        except Exception:
-            QMessageBox.critical(self.parent, 'Error', 'Could not removed user!')
+        writer.write([("INSERT INTO contacts(name, job, location, contact) VALUES (?, ?, ?, ?)", data)],
+                     lambda result: self.onContactsWritten(result, 'Record added successfully',
+                                                           'Could not add record!'))
+
+    def updateContact(self, rec_id, data):
+        writer.write([("UPDATE contacts SET name = ?, job = ?, location = ?, contact = ? WHERE id = ?",
+                       (*data, rec_id))],
+                     lambda result: self.onContactsWritten(result, 'Record updated successfully',
+                                                           'Could not update the record! Please try again'))
+
+    def removeContact(self, rec_id):
+        writer.write([("DELETE FROM contacts WHERE id = ?", (rec_id,))],
+                     lambda result: self.onContactsWritten(result, 'Record removed successfully',
+                                                           'Could not remove the record!'))
+
+    def removeContacts(self, ids):
+        # one command, all of the selection or none of it, and one refresh
+        writer.write([("DELETE FROM contacts WHERE id = ?", (rec_id,)) for rec_id in ids],
+                     lambda result: self.onContactsWritten(result, f'{len(ids)} records removed successfully',
+                                                           'Could not remove the records!'))
+
+    def updateContacts(self, ids, job, location):
+        # None keeps the current value
+        sql = "UPDATE contacts SET job = coalesce(?, job), location = coalesce(?, location) WHERE id = ?"
+        writer.write([(sql, (job, location, rec_id)) for rec_id in ids],
+                     lambda result: self.onContactsWritten(result, f'{len(ids)} records updated successfully',
+                                                           'Could not update the records! Please try again'))
+
+    def onContactsWritten(self, result, done, failed):
+        # no rows changed when another instance removed the contacts first
+        if result.ok and result.rows > 0:
+            # when the book is locked the refresh is left to the poll, and so is the message
+            self.message = done
+            self.parent.messageLabel.setText('')
+            self.refresh()
+        else:
+            self.parent.messageLabel.setText(failed)
+
+
+class UsersRepository(QObject):
+    # The users table for the whole application: accounts are looked up by
+    # username through idx_users_username and kept once read; every change is
+    # written through and announced with changed(username), an empty username
+    # when every account may have changed. Accounts are created right away, the
+    # login needs them; other changes go through the writer thread and report
+    # to callback(done) once committed.
+    changed = Signal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.cache = {}             # username -> (id, username, password)
+
+    def clear(self):
+        # the table was replaced behind the cache: any account may have changed
+        self.cache.clear()
+        self.changed.emit('')
+
+    def find(self, username):
+        user = self.cache.get(username)
+        if user is not None:
+            return user
+        query = Query()
+        query.prepare("SELECT id, username, password FROM users WHERE username = ?")
+        query.addBindValue(username)
+        query.exec()
+        if query.next():
+            user = (query.value(0), query.value(1), query.value(2))
+            self.cache[username] = user
+        query.finish()
+        return user
+
+    def authenticate(self, username, password):
+        user = self.find(username)
+        return user is not None and user[2] == password
+
+    def isEmpty(self):
+        query = Query("SELECT 1 FROM users LIMIT 1")
+        empty = not query.next()
+        query.finish()
+        return empty
+
+    def addUser(self, username, password):
+        query = Query()
+        query.prepare("INSERT INTO users(username, password) VALUES (?, ?)")
+        query.addBindValue(username)
+        query.addBindValue(password)
+        if not query.exec():
+            return False
+        self.cache[username] = (query.lastInsertId(), username, password)
+        self.changed.emit(username)
+        return True
+
+    def addDefaultUsers(self):
+        return all([self.addUser(username, password) for username, password in DEFAULT_USERS])
+
+    def changePassword(self, username, password, callback=None):
+        writer.write([("UPDATE users SET password = ? WHERE username = ?", (password, username))],
+                     lambda result: self.onUserWritten(username, result, callback))
+
+    def removeUser(self, username, callback=None):
+        writer.write([("DELETE FROM users WHERE username = ?", (username,))],
+                     lambda result: self.onUserWritten(username, result, callback))
+
+    def onUserWritten(self, username, result, callback):
+        done = result.ok and result.rows > 0
+        if done:
+            self.cache.pop(username, None)
+            self.changed.emit(username)
+        if callback is not None:
+            callback(done)
+
+
+users = UsersRepository()
@@ -18,7 +18,6 @@
 """
 
 from PySide6.QtGui import QFont
-from PySide6.QtSql import QSqlQuery
 from PySide6.QtWidgets import QApplication
 
 
@@ -43,45 +42,3 @@ def custom_font(widget=None, font_size=12, bold=False, underline=False):
     font.setBold(bold)
     font.setUnderline(underline)
     widget.setFont(font)
-
-# validation
-def alpha_or_space(text):
-    if all(char.isalpha() or char.isspace() for char in text):
-        return True
-    else:
-        return False
-
-
-def valid_space(text):
-    space = 0
-    for char in text:
-        if char == ' ':
-            space = space + 1
-            if space > 1:
-                return False
-        else:
-            space = 0
-    return True
-
-
-def min_length(length, min_len):
-    if length >= min_len:
-        return True
-    else:
-        return False
-
-
-def is_unique(mobile_number, rec_id):
-    result = (True, '')
-    if rec_id is None:
-        query = QSqlQuery(f'SELECT id, name, contact FROM contacts')
-    else:
-        query = QSqlQuery(f'SELECT id, name, contact FROM contacts WHERE id != {rec_id}')
-
-    while query.next():
-        person_name = query.value(1)
-        person_contact = query.value(2)
-        if person_contact == mobile_number:
-            result = (False, person_name)
-            return result
-    return result
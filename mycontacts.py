@@ -0,0 +1,253 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import argparse
+import os
+import sys
+
+from PySide6.QtCore import QCoreApplication
+
+from backup import BackupError, backup_book, list_backups, restore_book
+from connections import ProfileError, connections
+from database import createTables, schemaVersion, searchQuery, MigrationError
+from dedupe import contact_key, find_duplicates, merge_duplicates
+from exporter import export_contacts
+from fuzzy import fuzzy_search, MAX_RESULTS
+from importer import import_contacts
+from querylog import Query
+from validation import validate_contact, is_unique
+
+# Headless entry point for scripted maintenance: python -m mycontacts --help
+# No display is needed and no widget is created, but the PySide6.QtSql binding
+# loads QtGui and QtWidgets with it; most of the start-up time is loading PySide6.
+
+
+def connect(path):
+    try:
+        conn = connections.open(path)
+    except ProfileError as error:
+        sys.exit(str(error))
+    if not conn.isOpen():
+        sys.exit(f'Unable to connect to the database: {conn.lastError().text()}')
+    try:
+        createTables()
+    except MigrationError as error:
+        sys.exit(f'Unable to upgrade the database: {error}')
+    return conn
+
+
+def print_progress(percent, *counts):
+    print(f'\r{percent:3d}%', *counts, end='', file=sys.stderr, flush=True)
+
+
+def add(conn, args):
+    data, error = validate_contact([args.name, args.job, args.location, args.contact])
+    if data is None:
+        sys.exit(error)
+    unique, name = is_unique(data[3], None)
+    if not unique:
+        sys.exit(f'Contact number {data[3]} used by {name}')
+
+    query = Query(conn)
+    query.prepare("INSERT INTO contacts(name, job, location, contact) VALUES (?, ?, ?, ?)")
+    for value in data:
+        query.addBindValue(value)
+    if not query.exec():
+        sys.exit(query.lastError().text())
+    print(f'Added {data[0]} with id {query.lastInsertId()}')
+
+
+def search(conn, args):
+    if args.column == 'fuzzy':
+        rows = fuzzy_search(conn, args.text, args.limit if args.limit >= 0 else MAX_RESULTS)
+        for row in rows:
+            print('\t'.join(str(value) for value in row))
+        return
+
+    sql, pattern = searchQuery(args.column, args.text)
+    if pattern is None:
+        return
+    query = Query(conn)
+    query.setForwardOnly(True)
+    query.prepare(f'{sql} LIMIT :limit')
+    query.bindValue(':pattern', pattern)
+    query.bindValue(':limit', args.limit)
+    if not query.exec():
+        sys.exit(query.lastError().text())
+    while query.next():
+        print('\t'.join(str(query.value(col)) for col in range(5)))
+
+
+def import_file(conn, args):
+    imported, rejected, rejects = import_contacts(conn, args.file, print_progress)
+    print(file=sys.stderr)
+    for line_no, reason in rejects:
+        print(f'line {line_no}: {reason}', file=sys.stderr)
+    print(f'{imported} contact(s) imported, {rejected} rejected')
+
+
+def export_file(conn, args):
+    written = export_contacts(conn, args.file, args.column, args.text or '', print_progress)
+    print(file=sys.stderr)
+    print(f'{written} contact(s) exported to {args.file}')
+
+
+def dedupe(conn, args):
+    # lists groups of records that look like the same person; --remove merges the
+    # records sharing the number of the oldest one into it, look-alike names at
+    # the same location may be different people and are left for review
+    groups = find_duplicates(conn)
+    for reason, rows in groups:
+        print(reason)
+        for row in rows:
+            print('\t' + '\t'.join(str(value) for value in row))
+    if groups and args.remove:
+        removed = reviewed = 0
+        for reason, rows in groups:
+            number = contact_key(rows[0][4])
+            remove = [row[0] for row in rows[1:] if contact_key(row[4]) == number]
+            reviewed += len(rows) - 1 - len(remove)
+            if remove and not merge_duplicates(conn, rows[0][0], remove):
+                sys.exit(conn.lastError().text())
+            removed += len(remove)
+        print(f'{removed} duplicate record(s) removed')
+        if reviewed:
+            print(f'{reviewed} record(s) with another number left, review them with Contacts > Find Duplicates')
+        createTables()
+
+
+def stats(conn, args):
+    query = Query(conn)
+    query.exec("SELECT count(*), count(DISTINCT job), count(DISTINCT location) FROM contacts")
+    query.next()
+    print(f'contacts        {query.value(0)}')
+    print(f'jobs            {query.value(1)}')
+    print(f'locations       {query.value(2)}')
+    query.exec("SELECT count(*) FROM users")
+    query.next()
+    print(f'users           {query.value(0)}')
+    query.finish()
+    print(f'schema version  {schemaVersion()}')
+    print(f'file size       {os.path.getsize(args.database)} bytes')
+
+
+def vacuum(conn, args):
+    # schema upgrades that copy a table leave its old pages free inside the file
+    size = os.path.getsize(args.database)
+    query = Query(conn)
+    if not query.exec("VACUUM"):
+        sys.exit(query.lastError().text())
+    print(f'file size       {size} -> {os.path.getsize(args.database)} bytes')
+
+
+# backup and restore run without QtSql, see backup.py
+def backup(conn, args):
+    if args.list:
+        for path in list_backups(args.database):
+            print(f'{path}\t{os.path.getsize(path)} bytes')
+        return
+    try:
+        path = backup_book(args.database, print_progress)
+    except BackupError as error:
+        sys.exit(str(error))
+    print(file=sys.stderr)
+    print(f'Backed up to {path}')
+
+
+def restore(conn, args):
+    backups = list_backups(args.database)
+    path = args.file or (backups[0] if backups else None)
+    if path is None:
+        sys.exit(f'No backups of {args.database}')
+    try:
+        restore_book(args.database, path, print_progress)
+    except BackupError as error:
+        sys.exit(str(error))
+    print(file=sys.stderr)
+    print(f'Restored {args.database} from {path}')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='mycontacts', description='MyContacts command line tools')
+    parser.add_argument('-d', '--database', default='contacts.sqlite', help='database file (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('add', help='add a contact')
+    command.add_argument('name')
+    command.add_argument('job')
+    command.add_argument('location')
+    command.add_argument('contact')
+    command.set_defaults(func=add)
+
+    columns = ('name', 'job', 'location', 'contact', 'all')
+    command = commands.add_parser('search', help='list contacts starting with text')
+    command.add_argument('text')
+    command.add_argument('-c', '--column', choices=columns + ('fuzzy',), default='name')
+    command.add_argument('-l', '--limit', type=int, default=-1, help='maximum number of rows')
+    command.set_defaults(func=search)
+
+    command = commands.add_parser('import', help='import a CSV or vCard file')
+    command.add_argument('file')
+    command.set_defaults(func=import_file)
+
+    command = commands.add_parser('export', help='export to CSV, vCard (.vcf) or JSON Lines (.jsonl)')
+    command.add_argument('file')
+    command.add_argument('-c', '--column', choices=columns, help='only export contacts matching --text')
+    command.add_argument('-t', '--text', help='search text for --column')
+    command.set_defaults(func=export_file)
+
+    command = commands.add_parser('dedupe', help='list contacts entered more than once')
+    command.add_argument('--remove', action='store_true', help='merge each group into its oldest record')
+    command.set_defaults(func=dedupe)
+
+    command = commands.add_parser('stats', help='show database statistics')
+    command.set_defaults(func=stats)
+
+    command = commands.add_parser('vacuum', help='shrink the database file to the pages in use')
+    command.set_defaults(func=vacuum)
+
+    command = commands.add_parser('backup', help='back up the database while it is in use')
+    command.add_argument('--list', action='store_true', help='list the backups kept, newest first')
+    command.set_defaults(func=backup, qtsql=False)
+
+    command = commands.add_parser('restore', help='replace the contacts with a verified backup')
+    command.add_argument('file', nargs='?', help='backup to restore (default: the newest)')
+    command.set_defaults(func=restore, qtsql=False)
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'column', None) and getattr(args, 'text', None) is None:
+        parser.error('--column needs --text')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not getattr(args, 'qtsql', True):
+        args.func(None, args)
+        return
+    app = QCoreApplication([])
+    conn = connect(args.database)
+    args.func(conn, args)
+    del conn
+    connections.close()
+
+
+if __name__ == "__main__":
+    main()
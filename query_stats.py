@@ -0,0 +1,86 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QTableWidget, QTableWidgetItem,
+                               QPushButton, QAbstractItemView, QHeaderView)
+
+from module import custom_font
+from querylog import stats
+
+
+class QueryStatsDialog(QDialog):
+    # latencies of the statements run since start, from querylog.stats.report()
+    headers = ('Calls', 'p50 ms', 'p95 ms', 'p99 ms', 'Statement')
+
+    def __init__(self, parent):
+        super().__init__(parent=parent)
+        self.parent = parent
+        self.resize(int(self.parent.width() * .8), int(self.parent.height() * .6))
+        self.setWindowModality(Qt.WindowModal)
+        self.setWindowTitle('Query Statistics')
+        self.setStyleSheet("background-color: rgb(150, 200, 145)")
+        self.main_layout = QVBoxLayout()
+        self.setLayout(self.main_layout)
+
+        self.setupUI()
+        self.showReport()
+
+    def setupUI(self):
+        self.statsTable = QTableWidget(0, len(self.headers))
+        self.statsTable.setHorizontalHeaderLabels(self.headers)
+        self.statsTable.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.statsTable.horizontalHeader().setStretchLastSection(True)
+        self.statsTable.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.statsTable.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.statsTable.setWordWrap(False)
+        self.statsTable.setStyleSheet('background-color: rgb(245, 245, 245)')
+
+        self.hintLabel = QLabel()
+        self.hintLabel.setAlignment(Qt.AlignCenter)
+        custom_font(self.hintLabel, font_size=12, bold=False)
+
+        self.refreshButton = QPushButton('&Refresh')
+        self.closeButton = QPushButton('&Close')
+        for button in (self.refreshButton, self.closeButton):
+            button.setStyleSheet('background-color: rgba(150, 150, 150, 1)')
+        self.refreshButton.clicked.connect(self.showReport)
+        self.closeButton.clicked.connect(self.accept)
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(self.refreshButton)
+        buttons_layout.addWidget(self.closeButton)
+
+        self.main_layout.addWidget(self.statsTable)
+        self.main_layout.addWidget(self.hintLabel)
+        self.main_layout.addLayout(buttons_layout)
+
+    def showReport(self):
+        report = stats.report()
+        self.statsTable.setRowCount(len(report))
+        for row, (sql, calls, p50, p95, p99) in enumerate(report):
+            for col, value in enumerate((str(calls), f'{p50:.2f}', f'{p95:.2f}', f'{p99:.2f}', sql)):
+                item = QTableWidgetItem(value)
+                if col < 4:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                else:
+                    item.setToolTip(sql)
+                self.statsTable.setItem(row, col, item)
+        self.hintLabel.setText(f'{len(report)} statement(s), slowest p95 first')
@@ -0,0 +1,173 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import logging
+import os
+import sys
+import threading
+from collections import deque
+from functools import lru_cache
+from time import perf_counter, strftime
+
+from PySide6.QtSql import QSqlQuery
+
+# Every statement of the data layer runs through Query, a QSqlQuery that times
+# exec() and the fetching of its rows. Statements slower than SLOW_QUERY_MS are
+# written to SLOW_QUERY_LOG; both can be set through the environment.
+
+SLOW_QUERY_MS = float(os.environ.get('MYCONTACTS_SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG = os.environ.get('MYCONTACTS_SLOW_QUERY_LOG', 'slow_queries.log')
+SAMPLES = 1000              # latencies kept per statement for the percentiles
+
+slow_log = logging.getLogger('mycontacts.slow_queries')
+slow_log.propagate = False
+
+
+def configure(threshold_ms=None, path=None):
+    global SLOW_QUERY_MS, SLOW_QUERY_LOG
+    if threshold_ms is not None:
+        SLOW_QUERY_MS = threshold_ms
+    if path is not None:
+        SLOW_QUERY_LOG = path
+        for handler in slow_log.handlers[:]:
+            slow_log.removeHandler(handler)
+            handler.close()
+
+
+@lru_cache(maxsize=256)
+def normalized(sql):
+    # statements are counted and logged on one line
+    return ' '.join(sql.split())
+
+
+def site_text(site):
+    # the (code, line) a statement was run from, only turned into text when it is shown
+    if site is None:
+        return ''
+    code, line = site
+    return f'{os.path.basename(code.co_filename)}:{line} {code.co_name}'
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class QueryStats:
+    # Shared by all threads. Recording takes no lock: the GIL keeps the dict and
+    # deque operations whole, two threads counting the same statement at the
+    # same moment may only miss a call.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}           # sql -> deque of milliseconds
+        self.calls = {}             # sql -> number of executions
+        self.last = None            # (sql, milliseconds, rows, call site)
+
+    def record(self, sql, elapsed, rows, site):
+        # sql as normalized(), site as (code, line), see Query.exec()
+        samples = self.samples.get(sql)
+        if samples is None:
+            samples = self.samples.setdefault(sql, deque(maxlen=SAMPLES))
+        samples.append(elapsed)
+        self.calls[sql] = self.calls.get(sql, 0) + 1
+        self.last = (sql, elapsed, rows, site)
+
+        if elapsed >= SLOW_QUERY_MS:
+            with self.lock:
+                if not slow_log.handlers:
+                    slow_log.addHandler(logging.FileHandler(SLOW_QUERY_LOG, encoding='utf-8'))
+                    slow_log.setLevel(logging.INFO)
+            slow_log.info(f'{strftime("%Y-%m-%d %H:%M:%S")}\t{elapsed:.1f} ms\t{rows} rows\t{site_text(site)}\t{sql}')
+
+    def report(self):
+        # [(sql, calls, p50, p95, p99)] slowest p95 first
+        items = [(sql, self.calls.get(sql, 0), sorted(samples)) for sql, samples in list(self.samples.items())]
+        rows = [(sql, calls, percentile(ordered, .5), percentile(ordered, .95), percentile(ordered, .99))
+                for sql, calls, ordered in items]
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+
+stats = QueryStats()
+
+
+class Query(QSqlQuery):
+    # the time of a SELECT includes fetching its rows and is recorded when the
+    # rows are exhausted, on finish(), on the next exec() or when it is deleted
+    def __init__(self, *args):
+        sql = None
+        if args and isinstance(args[0], str):
+            sql, args = args[0], args[1:]
+        super().__init__(*args)
+        self.sql = ''
+        self.site = None
+        self.elapsed = 0.0
+        self.rows = 0
+        self.pending = False
+        if sql is not None:
+            self.exec(sql)
+
+    def prepare(self, sql):
+        self.sql = normalized(sql)
+        return super().prepare(sql)
+
+    def exec(self, sql=None):
+        self.record()
+        if sql is not None:
+            self.sql = normalized(sql)
+        # the caller, or the one of Query(sql)
+        frame = sys._getframe(1)
+        if frame.f_code is Query.__init__.__code__:
+            frame = frame.f_back
+        self.site = (frame.f_code, frame.f_lineno)
+        start = perf_counter()
+        ok = super().exec() if sql is None else super().exec(sql)
+        self.elapsed = perf_counter() - start
+        self.rows = 0
+        self.pending = True
+        if not self.isSelect():
+            self.rows = self.numRowsAffected()
+            self.record()
+        return ok
+
+    exec_ = exec
+
+    def next(self):
+        start = perf_counter()
+        more = super().next()
+        self.elapsed += perf_counter() - start
+        if more:
+            self.rows += 1
+        else:
+            self.record()
+        return more
+
+    def finish(self):
+        self.record()
+        super().finish()
+
+    def record(self):
+        if self.pending:
+            self.pending = False
+            stats.record(self.sql, self.elapsed * 1000, self.rows, self.site)
+
+    def __del__(self):
+        try:
+            self.record()
+        except Exception:
+            pass
@@ -0,0 +1,263 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from collections import OrderedDict
+from time import perf_counter
+
+from PySide6.QtCore import Qt, QObject, QThread, QTimer, QMetaObject, Signal, Slot
+
+from connections import connections
+from database import SORT_COLUMNS, ftsPattern, searchQuery
+from fuzzy import fuzzy_search
+from querylog import Query
+from models import NOCASE, ContactsRowsModel
+
+# combo box label, column and placeholder of each search mode
+SEARCH_MODES = [('Search by Name', 'name', 'Enter Name'),
+                ('Search by Job', 'job', 'Enter Job'),
+                ('Search by Location', 'location', 'Enter Location'),
+                ('Search by Contact Number', 'contact', 'Enter Contact Number'),
+                ('Search All Fields', 'all', 'Enter words to find in any field'),
+                ('Search Similar Names', 'fuzzy', 'Enter Name, typos are tolerated')]
+DEBOUNCE_MS = 150           # wait for a pause in typing before querying
+CHECK_EVERY = 500           # rows fetched between checks for a newer search
+CACHE_ROWS = 50000          # rows kept by ResultCache over all its searches
+PREFIX_COLUMNS = ('name', 'job', 'location', 'contact')
+
+
+def normalize(column, text):
+    # texts that search the same rows normalize alike: LIKE is case insensitive,
+    # full text search only sees the tokens and fuzzy search ignores outer spaces
+    if column == 'all':
+        return ftsPattern(text.translate(NOCASE)) or ''
+    if column == 'fuzzy':
+        return text.strip().translate(NOCASE)
+    return text.translate(NOCASE)
+
+
+class ResultCache:
+    # Least recently used search results, keyed by (column, normalized text, sort,
+    # descending). Everything is dropped once the contacts model records a write.
+    # A prefix search can also be answered from the results of a shorter prefix.
+
+    def __init__(self, contacts, max_rows=CACHE_ROWS):
+        self.contacts = contacts
+        self.max_rows = max_rows
+        self.rows = 0
+        self.entries = OrderedDict()
+        self.generation = contacts.generation
+
+    def current(self):
+        if self.generation != self.contacts.generation:
+            self.entries.clear()
+            self.rows = 0
+            self.generation = self.contacts.generation
+
+    def get(self, key):
+        self.current()
+        rows = self.entries.get(key)
+        if rows is not None:
+            self.entries.move_to_end(key)
+        return rows
+
+    def shorter(self, key):
+        # results of the longest cached prefix of the key's text, None if there is none;
+        # they are narrowed down on the search thread, see SearchWorker.narrow()
+        self.current()
+        column, text, sort, descending = key
+        if column not in PREFIX_COLUMNS:
+            return None
+        shorter = [cached for cached in self.entries
+                   if cached[0] == column and cached[2:] == key[2:] and text.startswith(cached[1])]
+        if not shorter:
+            return None
+        cached = max(shorter, key=lambda cached: len(cached[1]))
+        self.entries.move_to_end(cached)
+        return self.entries[cached]
+
+    def put(self, key, rows, generation=None):
+        # generation is the write generation the rows were read at
+        self.current()
+        if generation not in (None, self.generation) or len(rows) > self.max_rows:
+            return
+        if key in self.entries:
+            self.rows -= len(self.entries.pop(key))
+        self.entries[key] = rows
+        self.rows += len(rows)
+        while self.rows > self.max_rows:
+            self.rows -= len(self.entries.popitem(last=False)[1])
+
+
+class SearchWorker(QObject):
+    finished = Signal(int, object)
+
+    def __init__(self):
+        super().__init__()
+        self.conn = None
+        self.latest = 0         # generation of the newest search, set from the GUI thread
+
+    @Slot(int, str, str, str, bool, object)
+    def search(self, generation, column, text, sort, descending, shorter):
+        if generation != self.latest:
+            return
+
+        if shorter is not None:
+            self.narrow(generation, column, text, shorter)
+            return
+
+        if self.conn is None:
+            self.conn = connections.acquire()
+
+        if column == 'fuzzy':
+            rows = fuzzy_search(self.conn, text, sort=sort, descending=descending)
+            if generation == self.latest:
+                self.finished.emit(generation, rows)
+            return
+
+        sql, pattern = searchQuery(column, text, sort, descending)
+        rows = []
+        if pattern is None:
+            self.finished.emit(generation, rows)
+            return
+
+        query = Query(self.conn)
+        query.setForwardOnly(True)
+        query.prepare(sql)
+        query.bindValue(':pattern', pattern)
+        query.exec()
+
+        while query.next():
+            rows.append((query.value(0), query.value(1), query.value(2), query.value(3), query.value(4)))
+            if len(rows) % CHECK_EVERY == 0 and generation != self.latest:
+                query.finish()
+                return
+
+        query.finish()
+        if generation == self.latest:
+            self.finished.emit(generation, rows)
+
+    def narrow(self, generation, column, text, shorter):
+        # the rows of a shorter prefix that also start with the text, in their order
+        index = SORT_COLUMNS.index(column)
+        prefix = normalize(column, text)
+        rows = []
+        for number, row in enumerate(shorter, start=1):
+            if row[index].translate(NOCASE).startswith(prefix):
+                rows.append(row)
+            if number % CHECK_EVERY == 0 and generation != self.latest:
+                return
+        if generation == self.latest:
+            self.finished.emit(generation, rows)
+
+    @Slot()
+    def close(self):
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            connections.release(conn)
+
+
+class ContactsSearch(QObject):
+    requested = Signal(int, str, str, str, bool, object)
+    resultsReady = Signal(object, float)          # rows, milliseconds since the last keystroke
+
+    def __init__(self, contacts, parent):
+        super().__init__(parent)
+        self.contacts = contacts
+        self.generation = 0
+        self.column = None
+        self.text = ''
+        self.sort = ''              # empty for the search's own order, by name or by rank
+        self.descending = False
+        self.typed_at = 0.0
+        self.cache = ResultCache(contacts)
+        self.pending = None         # cache key and write generation of the search running
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(DEBOUNCE_MS)
+        self.timer.timeout.connect(self.start)
+
+        self.thread = QThread(self)
+        self.worker = SearchWorker()
+        self.worker.moveToThread(self.thread)
+        self.requested.connect(self.worker.search)
+        self.worker.finished.connect(self.onFinished)
+        self.thread.start()
+
+    def search(self, column, text):
+        self.column = column
+        self.text = text
+        self.typed_at = perf_counter()
+        self.cancel()
+        rows = self.cache.get(self.key())
+        if rows is not None:
+            self.resultsReady.emit(rows, (perf_counter() - self.typed_at) * 1000)
+            return
+        # narrowing cached rows queries nothing, it need not wait for a pause in typing
+        shorter = self.cache.shorter(self.key())
+        if shorter is None:
+            self.timer.start()
+        else:
+            self.start(shorter)
+
+    def key(self):
+        return self.column, normalize(self.column, self.text), self.sort, self.descending
+
+    def sortBy(self, sort, descending):
+        # applies from the next search
+        self.sort = sort
+        self.descending = descending
+
+    def cancel(self):
+        self.timer.stop()
+        self.generation += 1
+        self.worker.latest = self.generation
+
+    def start(self, shorter=None):
+        self.pending = self.key(), self.contacts.generation
+        self.requested.emit(self.generation, self.column, self.text, self.sort, self.descending, shorter)
+
+    def onFinished(self, generation, rows):
+        if generation == self.generation:
+            key, written = self.pending
+            self.cache.put(key, rows, written)
+            self.resultsReady.emit(rows, (perf_counter() - self.typed_at) * 1000)
+
+    def close(self):
+        self.cancel()
+        QMetaObject.invokeMethod(self.worker, "close", Qt.BlockingQueuedConnection)
+        self.thread.quit()
+        self.thread.wait()
+
+
+class SearchResultsModel(ContactsRowsModel):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.rows = []
+
+    def setRows(self, rows):
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    def rowCount(self, parent=None):
+        return len(self.rows)
+
+    def row(self, row):
+        return self.rows[row]
@@ -0,0 +1,72 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PySide6.QtCore import QCoreApplication
+
+from connections import connections
+from database import createTables
+from querylog import Query
+
+
+@pytest.fixture(scope='session')
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def book(app, tmp_path):
+    # an empty contacts book at the current schema, as the default connection
+    conn = connections.open(str(tmp_path / 'contacts.sqlite'))
+    createTables()
+    yield conn
+    del conn
+    connections.close()
+
+
+def add_contacts(conn, rows):
+    # (name, job, location, contact) rows in one transaction, returns their ids
+    ids = []
+    conn.transaction()
+    query = Query(conn)
+    query.prepare("INSERT INTO contacts(name, job, location, contact) VALUES (?, ?, ?, ?)")
+    for row in rows:
+        for value in row:
+            query.addBindValue(value)
+        assert query.exec(), query.lastError().text()
+        ids.append(query.lastInsertId())
+    query.finish()
+    conn.commit()
+    return ids
+
+
+def select(conn, sql, columns=1):
+    query = Query(conn)
+    assert query.exec(sql), query.lastError().text()
+    rows = []
+    while query.next():
+        rows.append(tuple(query.value(col) for col in range(columns)))
+    query.finish()
+    return rows
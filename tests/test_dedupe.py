@@ -0,0 +1,56 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from conftest import add_contacts
+from dedupe import contact_key, find_duplicates
+
+
+def test_contact_key():
+    assert contact_key('0123456789') == '0123456789'
+    assert contact_key('+91 01234-56789') == '0123456789'
+    assert contact_key('(0) 0123 456 789') == '0123456789'
+    assert contact_key('12 34') == '1234'
+    assert contact_key('n/a') == ''
+
+
+def test_find_duplicates_groups_and_reasons(book):
+    ids = add_contacts(book, [
+        ('ANNA SHARMA', 'DEV', 'PUNE', '9123456789'),           # 1
+        ('BO LEE', 'QA', 'AGRA', '8000000000'),                 # 2
+        ('A SHARMA', 'DEV', 'DELHI', '+91 91234 56789'),        # 3 same number as 1
+        ('Sharma  Anna', 'OPS', 'pune', '7000000000'),          # 4 same name and location as 1
+        ('BO LEE', 'QA', 'DELHI', '8000000001'),                # 5 same name as 2, elsewhere
+        ('ZED', 'QA', 'AGRA', 'n/a'),                           # 6 no number to compare
+        ('ZED', 'QA', 'PUNE', 'none'),                          # 7
+        ('CY YOUNG', 'QA', 'AGRA', '0123456789'),               # 8
+        ('CY YOUNG', 'QA', 'AGRA', '012-345-6789'),             # 9 entered twice
+    ])
+    assert ids == list(range(1, 10))
+    groups = find_duplicates(book)
+    assert [(reason, [row[0] for row in rows]) for reason, rows in groups] == [
+        ('same number, same name and location', [1, 3, 4]),
+        ('same number, same name and location', [8, 9]),
+    ]
+    assert groups[0][1][1] == (3, 'A SHARMA', 'DEV', 'DELHI', '+91 91234 56789')
+
+
+def test_find_duplicates_in_a_book_without_any(book):
+    assert find_duplicates(book) == []
+    add_contacts(book, [('ANNA SHARMA', 'DEV', 'PUNE', '9123456789'), ('BO LEE', 'QA', 'AGRA', '8000000000')])
+    assert find_duplicates(book) == []
@@ -0,0 +1,117 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import io
+
+from conftest import add_contacts, select
+from database import INSERT_TRIGGERS
+from fuzzy import fuzzy_search
+from importer import import_contacts, read_csv, read_vcard
+from models import ContactsTableModel
+
+
+def test_read_csv_without_header():
+    text = io.StringIO('Anna Sharma,Dev,Pune,0123456789\nBo Li,QA\n')
+    assert list(read_csv(text)) == [(1, ['Anna Sharma', 'Dev', 'Pune', '0123456789']),
+                                    (2, ['Bo Li', 'QA', '', ''])]
+
+
+def test_read_csv_header_names_the_columns():
+    text = io.StringIO('Contact,Location,Extra,Name,Job\n0123456789,Pune,x,"Sharma, Anna",Dev\n')
+    assert list(read_csv(text)) == [(2, ['Sharma, Anna', 'Dev', 'Pune', '0123456789'])]
+
+
+def test_read_csv_header_only_on_the_first_line():
+    text = io.StringIO('a,b,c,d\nname,job,location,contact\n')
+    assert [fields for _, fields in read_csv(text)] == [['a', 'b', 'c', 'd'], ['name', 'job', 'location', 'contact']]
+
+
+VCARDS = '''BEGIN:VCARD\r
+VERSION:3.0\r
+FN:Anna\r
+  Sharma\r
+TITLE:Dev\\, QA\r
+ADR;TYPE=HOME:;;1 Main St;Pune;MH;411001;India\r
+item1.TEL;TYPE=CELL:+91 01234 56789\r
+TEL:9999999999\r
+END:VCARD\r
+NOTE:outside a card\r
+begin:vcard\r
+fn:Bo Li\r
+adr:;;Street\r
+end:vcard\r
+'''
+
+
+def test_read_vcard():
+    cards = list(read_vcard(io.StringIO(VCARDS)))
+    assert cards == [(1, ['Anna Sharma', 'Dev, QA', 'Pune', '+91 01234 56789']),
+                     (11, ['Bo Li', '', '', ''])]
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_import_rejects_and_reports(book, tmp_path):
+    add_contacts(book, [('OLD ONE', 'DEV', 'PUNE', '9123456789')])
+    path = write(tmp_path, 'contacts.csv', 'name,job,location,contact\n'
+                                           'Anna Sharma,Dev,Pune,0123456789\n'
+                                           'Anna Again,Dev,Pune,0123456789\n'
+                                           'Old Two,Dev,Pune,9123456789\n'
+                                           'B1,Dev,Pune,12\n')
+    progress = []
+    imported, rejected, rejects = import_contacts(book, path, lambda *report: progress.append(report))
+    assert (imported, rejected) == (1, 3)
+    assert rejects == [(3, 'Contact number 0123456789 is already used'),
+                       (4, 'Contact number 9123456789 is already used'),
+                       (5, 'Name field accepts only alphabets and space(s)')]
+    assert progress[-1] == (100, 1, 3)
+    assert select(book, "SELECT name FROM contacts ORDER BY id") == [('OLD ONE',), ('ANNA SHARMA',)]
+
+
+def test_import_cancelled_adds_nothing(book, tmp_path):
+    path = write(tmp_path, 'contacts.csv', ''.join(f'Name {chr(65 + i % 26)},Dev,Pune,{7000000000 + i}\n'
+                                                   for i in range(3000)))
+    assert import_contacts(book, path, None, lambda: True)[0] == 0
+    assert select(book, "SELECT count(*) FROM contacts") == [(0,)]
+    assert len(select(book, f"SELECT name FROM sqlite_master WHERE name IN {INSERT_TRIGGERS}")) == 3
+
+
+def test_import_indexes_the_new_contacts(book, tmp_path):
+    add_contacts(book, [('ANNA SHARMA', 'DEV', 'PUNE', '9000000000')])
+    model = ContactsTableModel()
+    model.select()
+    path = write(tmp_path, 'contacts.csv', 'Zed Zorblat,Dev,Agra,0123456789\nAnna Sharma,Tester,Delhi,9000000001\n')
+    assert import_contacts(book, path)[:2] == (2, 0)
+
+    # the insert triggers are back, the indexes have the new rows as the triggers would have put them
+    assert len(select(book, f"SELECT name FROM sqlite_master WHERE name IN {INSERT_TRIGGERS}")) == 3
+    assert select(book, "SELECT rowid FROM contacts_fts WHERE contacts_fts MATCH '\"0123\"*'") == [(2,)]
+    assert select(book, "INSERT INTO contacts_fts(contacts_fts, rank) VALUES ('integrity-check', 1)") == []
+    assert [row[1] for row in fuzzy_search(book, 'ZED ZORBLAX')] == ['ZED ZORBLAT']
+    assert select(book, "SELECT count(*) FROM contact_names") == [(2,)]
+    add_contacts(book, [('ZED ZORBLAT', 'DEV', 'AGRA', '9000000002')])
+    assert [row[0] for row in fuzzy_search(book, 'ZED ZORBLAT')] == [2, 4]
+
+    # an open model cannot patch in the import from the change log, it reads the table again
+    assert model.applyChanges() is True
+    assert model.rowCount() == 4
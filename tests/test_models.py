@@ -0,0 +1,133 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import random
+
+import pytest
+from PySide6.QtCore import Qt
+
+from conftest import add_contacts, select
+from database import SORT_COLUMNS, contactColumns, orderBy
+from models import MAX_PAGES, PAGE_SIZE, RELOAD_AFTER, ContactsTableModel
+from querylog import Query
+
+NAMES = ['ANNA SHARMA', 'anna sharma', 'Anna Sharma', 'RAHUL GUPTA', 'ZOE KHAN', 'AMIT', 'amit', 'BO LI']
+WORDS = ['DEV', 'dev', 'PUNE', 'Delhi', 'DELHI', 'QA', 'ZURICH', 'agra']
+
+
+def random_contacts(rnd, count):
+    # few distinct values in every column, so that the sort keys tie and the ids decide
+    numbers = rnd.sample(range(10 ** 8, 10 ** 10), count)
+    return [(rnd.choice(NAMES), rnd.choice(WORDS), rnd.choice(WORDS), f'{number:010d}') for number in numbers]
+
+
+def ordered(conn, column, descending):
+    return select(conn, f"SELECT {contactColumns()} FROM contacts ORDER BY {orderBy(column, descending)}", 5)
+
+
+def model_rows(model):
+    return [model.row(row) for row in range(model.rowCount())]
+
+
+@pytest.fixture
+def model(book):
+    add_contacts(book, random_contacts(random.Random(4), PAGE_SIZE * (MAX_PAGES + 5) + 17))
+    model = ContactsTableModel()
+    model.select()
+    return model
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('column', range(len(SORT_COLUMNS)))
+def test_pages_follow_order_by(book, model, column, descending):
+    model.sort(column, Qt.DescendingOrder if descending else Qt.AscendingOrder)
+    expected = ordered(book, SORT_COLUMNS[column], descending)
+    assert model.rowCount() == len(expected)
+
+    # jumps in both directions, so that pages are read after a kept page, before
+    # one, from either end, and after others were evicted
+    rows = list(range(model.rowCount()))
+    random.Random(column * 2 + descending).shuffle(rows)
+    for row in rows[:600]:
+        assert model.row(row) == expected[row]
+    assert model_rows(model) == expected
+
+
+@pytest.mark.parametrize('column', range(len(SORT_COLUMNS)))
+def test_ids_match_rows(book, model, column):
+    model.sort(column, Qt.DescendingOrder)
+    expected = [row[0] for row in ordered(book, SORT_COLUMNS[column], True)]
+    rnd = random.Random(column)
+    for _ in range(10):
+        first = rnd.randrange(model.rowCount())
+        last = min(model.rowCount() - 1, first + rnd.randrange(3 * PAGE_SIZE))
+        assert model.ids(first, last) == expected[first:last + 1]
+
+
+def test_bounds_are_kept_with_their_pages(model):
+    for row in range(0, model.rowCount(), PAGE_SIZE // 2):
+        model.row(row)
+    assert len(model.pages) == MAX_PAGES
+    assert set(model.bounds) <= set(model.pages)
+
+
+def change(conn, rnd):
+    # a few inserts, updates that move rows and deletes, as another connection would make them
+    ids = [row[0] for row in select(conn, "SELECT id FROM contacts")]
+    conn.transaction()
+    query = Query(conn)
+    for contact in random_contacts(rnd, 5):
+        query.prepare("INSERT INTO contacts(name, job, location, contact) VALUES (?, ?, ?, ?)")
+        for value in contact:
+            query.addBindValue(value)
+        assert query.exec()
+    for rec_id in rnd.sample(ids, 5):
+        query.prepare("UPDATE contacts SET name = ?, job = ?, location = ? WHERE id = ?")
+        for value in (rnd.choice(NAMES), rnd.choice(WORDS), rnd.choice(WORDS), rec_id):
+            query.addBindValue(value)
+        assert query.exec()
+    for rec_id in rnd.sample(ids, 5):
+        query.prepare("DELETE FROM contacts WHERE id = ?")
+        query.addBindValue(rec_id)
+        query.exec()
+    query.finish()
+    conn.commit()
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('column', range(len(SORT_COLUMNS)))
+def test_apply_changes_keeps_order_by(book, model, column, descending):
+    model.sort(column, Qt.DescendingOrder if descending else Qt.AscendingOrder)
+    rnd = random.Random(100 + column)
+    for _ in range(3):
+        # some pages cached, the rest to be read again after the changes
+        for row in rnd.sample(range(model.rowCount()), 5):
+            model.row(row)
+        change(book, rnd)
+        assert model.applyChanges() is True
+        assert model_rows(model) == ordered(book, SORT_COLUMNS[column], descending)
+    assert model.applyChanges() is False
+
+
+def test_apply_changes_reads_again_after_many(book, model):
+    model.row(0)
+    add_contacts(book, random_contacts(random.Random(5), RELOAD_AFTER + 1))
+    assert model.applyChanges() is True
+    assert model_rows(model) == ordered(book, 'name', False)
+    assert model.seq == select(book, "SELECT seq FROM sqlite_sequence WHERE name = 'contact_changes'")[0][0]
@@ -0,0 +1,66 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import random
+
+from validation import CONTACT, FieldError
+
+
+def test_validate_batch_cleans_valid_records():
+    data, errors = CONTACT.validate_batch([['  anna sharma ', 'dev', ' Pune', '(012) 345-6789'],
+                                           ['Bo Lee', 'Tester', 'Agra', '9123456789']])
+    assert errors == []
+    assert [list(row) for row in data] == [['ANNA SHARMA', 'DEV', 'PUNE', '0123456789'],
+                                           ['BO LEE', 'TESTER', 'AGRA', '9123456789']]
+
+
+def test_validate_batch_reports_by_row_then_field():
+    data, errors = CONTACT.validate_batch([['Anna Sharma', 'Dev', 'Pune', '0123456789'],
+                                           ['Bo', 'Dev1', 'Agra', '12'],
+                                           ['Cy  Young', 'Dev', 'Agra', '0123456789']])
+    assert data[0] == ('ANNA SHARMA', 'DEV', 'PUNE', '0123456789')
+    assert data[1] is None and data[2] is None
+    assert errors == [
+        FieldError(1, 'name', 'length_error', 'Minimum 3 characters required for Name field'),
+        FieldError(1, 'job', 'alpha_space_error', 'Job field accepts only alphabets and space(s)'),
+        FieldError(1, 'contact', 'digits_error', 'Contact number must have 10 digits'),
+        FieldError(2, 'name', 'space_error', 'Two or more continuous spaces are not allowed in Name field'),
+    ]
+
+
+def test_validate_batch_of_nothing():
+    assert CONTACT.validate_batch([]) == ([], [])
+
+
+def test_validate_batch_agrees_with_validate():
+    rnd = random.Random(18)
+    valid = ['Anna Sharma', ' bo lee ', 'ZOË', 'Tester']
+    invalid = ['Bo', 'Dev1', 'Anna  Sharma', 'R2D2', '', 'A\tB C', '-']
+    numbers = ['0123456789', '(012) 345-6789', '012345678', '+91 0123456789', '']
+
+    def value():
+        return rnd.choice(valid if rnd.random() < .8 else invalid)
+
+    records = [[value(), value(), value(), rnd.choice(numbers)] for _ in range(500)]
+    data, errors = CONTACT.validate_batch(records)
+    assert 50 < sum(row is not None for row in data) < 450
+    for row, record in enumerate(records):
+        cleaned, record_errors = CONTACT.validate(record)
+        assert data[row] == (None if record_errors else tuple(cleaned))
+        assert [error[1:] for error in errors if error.row == row] == [error[1:] for error in record_errors]
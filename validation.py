@@ -0,0 +1,155 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+from collections import namedtuple
+
+from querylog import Query
+
+# Declarative validation of contact records, shared by the contact dialogs, the
+# importer and the command line. The rules of a field are compiled into one
+# regular expression accepting exactly the values that pass all of them; only
+# a value failing it is checked rule by rule to tell what is wrong.
+
+FieldError = namedtuple('FieldError', 'row field code message')
+NON_DIGITS = re.compile(r'\D')
+
+
+class Rule:
+    # a value passes when pattern matches the whole of it
+    def __init__(self, code, pattern, message):
+        self.code = code
+        self.pattern = re.compile(pattern, re.DOTALL)
+        self.message = message
+
+
+def letters_or_spaces():
+    # runs of letters and of white space; written so that a failing match cannot backtrack far
+    return Rule('alpha_space_error', r'[^\W\d_]*(?:\s+[^\W\d_]+)*\s*',
+                '{field} field accepts only alphabets and space(s)')
+
+
+def single_spaces():
+    return Rule('space_error', r'[^ ]*(?: [^ ]+)* ?', 'Two or more continuous spaces are not allowed in {field} field')
+
+
+def min_length(length):
+    return Rule('length_error', f'.{{{length},}}', f'Minimum {length} characters required for {{field}} field')
+
+
+def digits(count):
+    return Rule('digits_error', f'\\d{{{count}}}', f'{{field}} number must have {count} digits')
+
+
+def only_digits(value):
+    return value if value.isdecimal() else NON_DIGITS.sub('', value)
+
+
+class Field:
+    def __init__(self, name, label, rules, clean=(str.strip, str.upper)):
+        self.name = name
+        self.label = label
+        self.rules = rules
+        self.steps = clean          # applied before the rules, the cleaned value is what gets stored
+        self.valid = re.compile(''.join(f'(?=(?:{rule.pattern.pattern})\\Z)' for rule in rules), re.DOTALL)
+
+    def clean(self, value):
+        for step in self.steps:
+            value = step(value)
+        return value
+
+    def cleanAll(self, values):
+        for step in self.steps:
+            values = map(step, values)
+        return list(values)
+
+    def check(self, value):
+        # (code, message) of the first rule a cleaned value breaks, None if it passes
+        if self.valid.match(value):
+            return None
+        for rule in self.rules:
+            if not rule.pattern.fullmatch(value):
+                return rule.code, rule.message.format(field=self.label)
+
+
+class Validator:
+    def __init__(self, fields):
+        self.fields = fields
+
+    def field(self, name):
+        return next(field for field in self.fields if field.name == name)
+
+    def validate(self, values):
+        # one record: (cleaned values, list of FieldError in field order)
+        data = []
+        errors = []
+        for field, value in zip(self.fields, values):
+            value = field.clean(value)
+            error = field.check(value)
+            if error is not None:
+                errors.append(FieldError(0, field.name, *error))
+            data.append(value)
+        return data, errors
+
+    def validate_batch(self, records):
+        # many records, one column at a time: (cleaned records, list of FieldError
+        # ordered by row then field); records with errors come back as None
+        columns = []
+        errors = []
+        for field, values in zip(self.fields, zip(*records)):
+            values = field.cleanAll(values)
+            matches = list(map(field.valid.match, values))
+            if None in matches:
+                for row in [row for row, match in enumerate(matches) if match is None]:
+                    errors.append(FieldError(row, field.name, *field.check(values[row])))
+            columns.append(values)
+
+        data = list(zip(*columns))
+        for error in errors:
+            data[error.row] = None
+        errors.sort(key=lambda error: error.row)
+        return data, errors
+
+
+CONTACT = Validator([
+    Field('name', 'Name', [letters_or_spaces(), single_spaces(), min_length(3)]),
+    Field('job', 'Job', [letters_or_spaces(), single_spaces(), min_length(3)]),
+    Field('location', 'Location', [letters_or_spaces(), single_spaces(), min_length(3)]),
+    Field('contact', 'Contact', [digits(10)], clean=(only_digits,)),
+])
+
+
+def is_unique(mobile_number, rec_id):
+    # point lookup on the unique index idx_contacts_contact
+    query = Query()
+    query.prepare('SELECT name FROM contacts WHERE contact = :contact AND id IS NOT :id LIMIT 1')
+    query.bindValue(':contact', mobile_number)
+    query.bindValue(':id', rec_id)
+    query.exec()
+    if query.next():
+        return False, query.value(0)
+    return True, ''
+
+
+def validate_contact(fields):
+    # returns (data, error) with the message of the first error
+    data, errors = CONTACT.validate(fields)
+    if errors:
+        return None, errors[0].message
+    return data, ''
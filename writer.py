@@ -0,0 +1,161 @@
+"""
+    Copyright © 2021  Mosleuddin Sarkar
+
+    This file is part of MyContacts.
+
+    MyContacts is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    MyContacts is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with MyContacts.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from collections import namedtuple
+from queue import Empty, SimpleQueue
+
+from PySide6.QtCore import QObject, QThread, Signal, Slot
+from connections import connections
+from querylog import Query
+
+# Writes of the GUI run on one writer thread with a connection of its own, so
+# the window never waits for the disk. The commands queued while a transaction
+# commits are committed together by the next one: a burst of writes costs one
+# sync instead of one each. Every command still succeeds or fails on its own,
+# inside a savepoint, and its callback is run on the GUI thread with the result.
+
+MAX_GROUP = 1000            # commands committed by one transaction at most
+
+# statements: (sql, values) pairs executed in order; callback(WriteResult) or None
+WriteCommand = namedtuple('WriteCommand', 'statements callback')
+# last_id: id of the last row inserted, rows: rows changed by all the statements
+WriteResult = namedtuple('WriteResult', 'ok last_id rows error')
+
+
+class WriteWorker(QObject):
+    finished = Signal(int, object)  # generation of the writer, [(command, result)] of a committed group
+
+    def __init__(self, commands, generation):
+        super().__init__()
+        self.commands = commands
+        self.generation = generation
+        self.prepared = {}          # sql -> Query, statements are compiled once
+
+    @Slot()
+    def run(self):
+        conn = connections.acquire()
+        stopping = False
+        while not stopping:
+            # None, put by Writer.close(), stops the thread once the commands before it are written
+            command = self.commands.get()
+            if command is None:
+                break
+            group = [command]
+            while len(group) < MAX_GROUP:
+                try:
+                    command = self.commands.get_nowait()
+                except Empty:
+                    break
+                if command is None:
+                    stopping = True
+                    break
+                group.append(command)
+            self.finished.emit(self.generation, self.commit(conn, group))
+        self.prepared.clear()
+        connections.release(conn)
+
+    def commit(self, conn, group):
+        results = []
+        if not conn.transaction():
+            error = conn.lastError().text()
+            return [(command, WriteResult(False, None, 0, error)) for command in group]
+
+        for command in group:
+            self.query(conn, "SAVEPOINT command").exec()
+            result = self.execute(conn, command)
+            if not result.ok:
+                self.query(conn, "ROLLBACK TO command").exec()
+            self.query(conn, "RELEASE command").exec()
+            results.append((command, result))
+
+        if not conn.commit():
+            error = conn.lastError().text()
+            conn.rollback()
+            return [(command, WriteResult(False, None, 0, error)) for command in group]
+        return results
+
+    def query(self, conn, sql):
+        query = self.prepared.get(sql)
+        if query is None:
+            query = self.prepared[sql] = Query(conn)
+            query.prepare(sql)
+        return query
+
+    def execute(self, conn, command):
+        last_id, rows = None, 0
+        for sql, values in command.statements:
+            query = self.query(conn, sql)
+            for index, value in enumerate(values):
+                query.bindValue(index, value)
+            if not query.exec():
+                return WriteResult(False, None, 0, query.lastError().text())
+            rows += query.numRowsAffected()
+            if sql.lstrip().upper().startswith('INSERT'):
+                last_id = query.lastInsertId()
+        return WriteResult(True, last_id, rows, '')
+
+
+class Writer(QObject):
+    # GUI side of the writer thread, started by the first write
+    def __init__(self):
+        super().__init__()
+        self.commands = SimpleQueue()
+        self.thread = None
+        self.worker = None
+        self.pending = 0            # commands queued and not yet called back
+        self.generation = 0         # bumped by close(), results of an older thread are dropped
+
+    def write(self, statements, callback=None):
+        if self.thread is None:
+            self.start()
+        self.pending += 1
+        self.commands.put(WriteCommand(statements, callback))
+
+    def start(self):
+        self.thread = QThread()
+        self.worker = WriteWorker(self.commands, self.generation)
+        self.worker.moveToThread(self.thread)
+        self.thread.started.connect(self.worker.run)
+        self.worker.finished.connect(self.onFinished)
+        self.thread.start()
+
+    def onFinished(self, generation, results):
+        # results queued to the GUI thread before close() arrive after it
+        if generation != self.generation:
+            return
+        for command, result in results:
+            self.pending -= 1
+            if command.callback is not None:
+                command.callback(result)
+
+    def close(self):
+        # waits for the commands queued so far to be written, their callbacks are not run
+        if self.thread is None:
+            return
+        self.generation += 1
+        self.worker.finished.disconnect(self.onFinished)
+        self.commands.put(None)
+        self.thread.quit()
+        self.thread.wait()
+        self.worker.deleteLater()
+        self.thread = self.worker = None
+        self.pending = 0
+
+
+writer = Writer()